@@ -1,11 +1,127 @@
 # dashboards/ecommerce_dashboard.py
 import streamlit as st
-import plotly.express as px
-import plotly.graph_objects as go
-from plotly.subplots import make_subplots
 import pandas as pd
 import numpy as np
 from datetime import datetime, timedelta
+import hashlib
+
+def _session_id():
+    """Id de la sesión de navegador actual (None fuera de un script run)"""
+    from streamlit.runtime.scriptrunner import get_script_run_ctx
+    
+    ctx = get_script_run_ctx()
+    return ctx.session_id if ctx else None
+
+# Atributos de credenciales de los conectores: si cambian, cambian los datos
+_CREDENTIAL_ATTRS = (
+    'access_token', 'api_key', 'consumer_key', 'consumer_secret',
+    'shop_url', 'site_url', 'server', 'property_id', 'ad_account_id'
+)
+
+def _data_fingerprint(connected):
+    """Clave de caché: cada conector activo con su última sincronización y hash de credenciales"""
+    state = st.session_state
+    fingerprint = []
+    for name in sorted(connected):
+        connector = connected[name]
+        # Configuración guardada: dict en connector_<clave> o dataclass (Meta) en <clave>
+        saved = state.get(f'connector_{name}') or state.get(name)
+        last_sync = saved.get('last_sync') if isinstance(saved, dict) else getattr(saved, 'last_sync', None)
+        credentials = '\0'.join(str(getattr(connector, attr, None) or '') for attr in _CREDENTIAL_ATTRS)
+        fingerprint.append((
+            name,
+            last_sync,
+            hashlib.blake2b(credentials.encode(), digest_size=8).hexdigest()
+        ))
+    return tuple(fingerprint)
+
+@st.cache_data(ttl=300, show_spinner=False)
+def _cached_process(fingerprint, session_id, _data_processor, _integration_manager):
+    """Datos procesados durante 5 minutos, mientras no cambien conectores, credenciales ni sincronización"""
+    return _data_processor.process_multi_source_data(_integration_manager)
+
+@st.cache_data(ttl=300, show_spinner=False)
+def _cached_insights(fingerprint, session_id, last_updated, _ai_analyzer, _raw_data):
+    """Insights de IA para un mismo procesamiento de datos, sin recalcular en cada rerun"""
+    return _ai_analyzer.analyze_performance_data(_raw_data)
+
+def _flatten_kpis(kpis):
+    """Aplanar {métrica: {value, trend, ...}} a {métrica: (value, trend)} en una sola pasada"""
+    return {name: (kpi.get('value', 0), kpi.get('trend', 0)) for name, kpi in kpis.items()}
+
+# Color del borde de cada tarjeta KPI según su estado
+_KPI_COLORS = {
+    "success": "#28a745",
+    "warning": "#ffc107",
+    "error": "#dc3545",
+    "info": "#17a2b8"
+}
+
+_PRIORITY_COLORS = {
+    'alta': '#dc3545',
+    'media': '#ffc107',
+    'baja': '#28a745'
+}
+
+_AUDIENCE_COLORS = {
+    'excelente': '#28a745',
+    'bueno': '#17a2b8',
+    'regular': '#ffc107',
+    'bajo': '#dc3545'
+}
+
+# Tarjetas de insights; cada pestaña las concatena en un único st.markdown
+_OPPORTUNITY_TEMPLATE = """
+<div style='border-left: 4px solid {color}; 
+            background: #f8f9fa; padding: 1rem; border-radius: 5px; margin: 1rem 0;'>
+    <h5 style='margin: 0; color: #333;'>{title}</h5>
+    <p style='margin: 0.5rem 0; color: #666;'>{description}</p>
+    <p style='margin: 0; color: #28a745; font-weight: bold;'>
+        💡 Impacto potencial: {impact}
+    </p>
+    {actions}
+</div>
+"""
+
+_ACTIONS_TEMPLATE = """<p style='margin: 0.5rem 0 0 0;'><strong>Acciones recomendadas:</strong></p><ul style='margin: 0;'>{items}</ul>"""
+
+_SCALING_TEMPLATE = """
+<div style='border: 2px solid {color}; background: #f8f9fa; 
+            padding: 1rem; border-radius: 10px; margin: 1rem 0;'>
+    <h5 style='margin: 0; color: {color};'>{icon} {title}</h5>
+    <p style='margin: 0.5rem 0;'><strong>Canal:</strong> {channel}</p>
+    <p style='margin: 0.5rem 0;'><strong>ROAS Actual:</strong> {current_roas:.1f}x</p>
+    <p style='margin: 0.5rem 0;'><strong>Acción:</strong> {action}</p>
+    <p style='margin: 0; color: #28a745;'><strong>Impacto:</strong> {impact}</p>
+</div>
+"""
+
+_PRODUCT_INSIGHT_TEMPLATE = """
+<div style='border: 1px solid #dee2e6; border-radius: 5px; padding: 1rem; margin: 0.5rem 0;'>
+    <h6 style='margin: 0 0 0.5rem 0;'>💡 {product}</h6>
+    <p style='margin: 0.3rem 0;'><strong>Análisis:</strong> {insight}</p>
+    <p style='margin: 0.3rem 0;'><strong>Recomendación:</strong> {recommendation}</p>
+    <p style='margin: 0; color: #28a745;'><strong>Impacto:</strong> {impact}</p>
+</div>
+"""
+
+_AUDIENCE_TEMPLATE = """
+<div style='border-left: 4px solid {color}; background: #f8f9fa; 
+            padding: 1rem; border-radius: 5px; margin: 1rem 0;'>
+    <h6 style='margin: 0; color: #333;'>{name}</h6>
+    <p style='margin: 0.3rem 0;'><strong>ROAS:</strong> {roas:.1f}x</p>
+    <p style='margin: 0.3rem 0;'><strong>% Presupuesto:</strong> {spend_percentage:.1f}%</p>
+    <p style='margin: 0; color: {color}; font-weight: bold;'>
+        {recommendation}
+    </p>
+</div>
+"""
+
+def _actions_html(actions):
+    """Lista HTML de hasta 3 acciones recomendadas ('' si no hay)"""
+    if not actions:
+        return ''
+    return _ACTIONS_TEMPLATE.format(items=''.join(f"<li>{action}</li>" for action in actions[:3]))
 
 class EcommerceDashboard:
     def __init__(self, data_processor, ai_analyzer):
@@ -27,8 +143,12 @@ class EcommerceDashboard:
         </div>
         """, unsafe_allow_html=True)
         
-        # Procesar datos
-        processed_data = self.data_processor.process_multi_source_data(integration_manager)
+        # Procesar datos (cacheado por conectores activos, sus credenciales y sesión)
+        fingerprint = _data_fingerprint(integration_manager.get_connected_connectors())
+        processed_data = _cached_process(
+            fingerprint, _session_id(), self.data_processor, integration_manager
+        )
+        self.data_processor.processed_cache = processed_data
         kpis = self.data_processor.get_kpi_metrics(processed_data)
         
         # Mostrar métricas principales
@@ -49,107 +169,62 @@ class EcommerceDashboard:
             self._render_marketing_channels(processed_data)
         
         # Insights de IA
-        self._render_ai_insights(processed_data)
+        self._render_ai_insights(processed_data, fingerprint)
     
     def _render_kpi_section(self, kpis):
         """Renderizar sección de KPIs principales"""
         st.markdown("### 📊 Métricas Principales")
         
-        # Primera fila de KPIs
-        col1, col2, col3, col4 = st.columns(4)
-        
-        with col1:
-            revenue = kpis['total_revenue']
-            self._render_kpi_card(
-                "💰 Revenue Total",
-                f"${revenue['value']:,.0f}",
-                revenue['trend'],
-                "success" if revenue['trend'] > 0 else "error"
-            )
+        flat = _flatten_kpis(kpis)
+        revenue, revenue_trend = flat['total_revenue']
+        roas, roas_trend = flat['overall_roas']
+        conversions, conversions_trend = flat['total_conversions']
+        spend, spend_trend = flat['total_spend']
+        ctr, ctr_trend = flat['overall_ctr']
+        conversion_rate, conversion_rate_trend = flat['overall_conversion_rate']
         
-        with col2:
-            roas = kpis['overall_roas']
-            self._render_kpi_card(
-                "📈 ROAS Promedio",
-                f"{roas['value']:.1f}x",
-                roas['trend'],
-                "success" if roas['value'] >= 3 else "warning" if roas['value'] >= 2 else "error"
-            )
+        # AOV y CAC calculados a partir de los mismos KPIs
+        aov = revenue / conversions if conversions > 0 else 0
+        cac = spend / conversions if conversions > 0 else 0
         
-        with col3:
-            conversions = kpis['total_conversions']
-            self._render_kpi_card(
-                "🎯 Conversiones",
-                f"{conversions['value']:,}",
-                conversions['trend'],
-                "success" if conversions['trend'] > 0 else "error"
-            )
-        
-        with col4:
-            spend = kpis['total_spend']
-            self._render_kpi_card(
-                "💸 Gasto Publicitario",
-                f"${spend['value']:,.0f}",
-                spend['trend'],
-                "error" if spend['trend'] > 20 else "warning" if spend['trend'] > 10 else "success"
-            )
+        # Primera fila de KPIs
+        self._render_kpi_row((
+            ("💰 Revenue Total", f"${revenue:,.0f}", revenue_trend,
+             "success" if revenue_trend > 0 else "error"),
+            ("📈 ROAS Promedio", f"{roas:.1f}x", roas_trend,
+             "success" if roas >= 3 else "warning" if roas >= 2 else "error"),
+            ("🎯 Conversiones", f"{conversions:,}", conversions_trend,
+             "success" if conversions_trend > 0 else "error"),
+            ("💸 Gasto Publicitario", f"${spend:,.0f}", spend_trend,
+             "error" if spend_trend > 20 else "warning" if spend_trend > 10 else "success")
+        ))
         
         # Segunda fila de KPIs (métricas específicas de e-commerce)
-        col1, col2, col3, col4 = st.columns(4)
-        
-        with col1:
-            # AOV calculado
-            aov = revenue['value'] / conversions['value'] if conversions['value'] > 0 else 0
-            self._render_kpi_card(
-                "🛒 AOV",
-                f"${aov:.0f}",
-                np.random.uniform(-5, 15),  # Simular tendencia
-                "success"
-            )
-        
-        with col2:
-            ctr = kpis['overall_ctr']
-            self._render_kpi_card(
-                "👆 CTR Promedio",
-                f"{ctr['value']:.1f}%",
-                ctr['trend'],
-                "success" if ctr['value'] >= 2 else "warning"
-            )
-        
-        with col3:
-            # CAC calculado
-            cac = spend['value'] / conversions['value'] if conversions['value'] > 0 else 0
-            self._render_kpi_card(
-                "👥 CAC",
-                f"${cac:.0f}",
-                np.random.uniform(-10, 5),  # Simular tendencia
-                "success" if cac < 50 else "warning"
-            )
-        
-        with col4:
-            conversion_rate = kpis['overall_conversion_rate']
-            self._render_kpi_card(
-                "⚡ Tasa Conversión",
-                f"{conversion_rate['value']:.1f}%",
-                conversion_rate['trend'],
-                "success" if conversion_rate['value'] >= 2 else "warning"
-            )
+        self._render_kpi_row((
+            ("🛒 AOV", f"${aov:.0f}", np.random.uniform(-5, 15),  # Simular tendencia
+             "success"),
+            ("👆 CTR Promedio", f"{ctr:.1f}%", ctr_trend,
+             "success" if ctr >= 2 else "warning"),
+            ("👥 CAC", f"${cac:.0f}", np.random.uniform(-10, 5),  # Simular tendencia
+             "success" if cac < 50 else "warning"),
+            ("⚡ Tasa Conversión", f"{conversion_rate:.1f}%", conversion_rate_trend,
+             "success" if conversion_rate >= 2 else "warning")
+        ))
+    
+    def _render_kpi_row(self, cards):
+        """Renderizar una fila de tarjetas KPI (título, valor, tendencia, tipo de color)"""
+        for col, card in zip(st.columns(len(cards)), cards):
+            with col:
+                self._render_kpi_card(*card)
     
     def _render_kpi_card(self, title, value, trend, color_type):
         """Renderizar tarjeta KPI individual"""
-        color_map = {
-            "success": "#28a745",
-            "warning": "#ffc107", 
-            "error": "#dc3545",
-            "info": "#17a2b8"
-        }
-        
         trend_icon = "↗️" if trend > 0 else "↘️" if trend < 0 else "➡️"
         trend_color = "#28a745" if trend > 0 else "#dc3545" if trend < 0 else "#6c757d"
         
         st.markdown(f"""
         <div style='background: linear-gradient(135deg, white 0%, #f8f9fa 100%); 
-                    border-left: 4px solid {color_map[color_type]}; 
+                    border-left: 4px solid {_KPI_COLORS[color_type]}; 
                     border-radius: 10px; padding: 1rem; margin: 0.5rem 0;
                     box-shadow: 0 2px 4px rgba(0,0,0,0.1);'>
             <h6 style='margin: 0; color: #666; font-size: 0.9rem;'>{title}</h6>
@@ -198,6 +273,8 @@ class EcommerceDashboard:
     
     def _render_sales_analysis(self, processed_data):
         """Renderizar análisis de ventas"""
+        import plotly.express as px
+        
         with st.container():
             st.markdown("""
             <div style='background: linear-gradient(135deg, #667eea 0%, #764ba2 100%); 
@@ -243,6 +320,8 @@ class EcommerceDashboard:
     
     def _render_customer_analysis(self, processed_data):
         """Renderizar análisis de clientes"""
+        import plotly.express as px
+        
         with st.container():
             st.markdown("""
             <div style='background: linear-gradient(135deg, #28a745 0%, #20c997 100%); 
@@ -359,14 +438,16 @@ class EcommerceDashboard:
                     performance_score = min(100, (channel['roas'] / 5.0) * 100)
                     st.progress(performance_score / 100)
     
-    def _render_ai_insights(self, processed_data):
+    def _render_ai_insights(self, processed_data, fingerprint=()):
         """Renderizar insights de IA específicos para e-commerce"""
         st.markdown("### 🤖 Insights de IA para E-commerce")
         
         # Generar insights específicos
-        insights = self.ai_analyzer.analyze_performance_data(
-            processed_data.get('raw_data', {})
+        insights = _cached_insights(
+            fingerprint, _session_id(), processed_data.get('last_updated'),
+            self.ai_analyzer, processed_data.get('raw_data', {})
         )
+        self.ai_analyzer.insights_cache = insights
         
         # Mostrar insights en tabs
         tab1, tab2, tab3, tab4 = st.tabs(["🎯 Oportunidades", "📈 Escalado", "🛒 Productos", "👥 Audiencias"])
@@ -388,30 +469,18 @@ class EcommerceDashboard:
         opportunities = insights.get('optimization_opportunities', [])
         
         if opportunities:
-            for i, opp in enumerate(opportunities[:3]):  # Mostrar top 3
-                priority_colors = {
-                    'alta': '#dc3545',
-                    'media': '#ffc107',
-                    'baja': '#28a745'
-                }
-                
-                st.markdown(f"""
-                <div style='border-left: 4px solid {priority_colors.get(opp.get("priority", "media"), "#ffc107")}; 
-                            background: #f8f9fa; padding: 1rem; border-radius: 5px; margin: 1rem 0;'>
-                    <h5 style='margin: 0; color: #333;'>{opp.get("title", "Oportunidad de Optimización")}</h5>
-                    <p style='margin: 0.5rem 0; color: #666;'>{opp.get("description", "")}</p>
-                    <p style='margin: 0; color: #28a745; font-weight: bold;'>
-                        💡 Impacto potencial: {opp.get("potential_impact", "Mejora significativa")}
-                    </p>
-                </div>
-                """, unsafe_allow_html=True)
-                
-                # Mostrar acciones recomendadas
-                actions = opp.get('actions', [])
-                if actions:
-                    st.write("**Acciones recomendadas:**")
-                    for action in actions[:3]:
-                        st.write(f"• {action}")
+            # Top 3 en un único bloque HTML en lugar de un mensaje por elemento
+            cards = '\n'.join(
+                _OPPORTUNITY_TEMPLATE.format(
+                    color=_PRIORITY_COLORS.get(opp.get("priority", "media"), "#ffc107"),
+                    title=opp.get("title", "Oportunidad de Optimización"),
+                    description=opp.get("description", ""),
+                    impact=opp.get("potential_impact", "Mejora significativa"),
+                    actions=_actions_html(opp.get('actions', []))
+                ).strip()
+                for opp in opportunities[:3]
+            )
+            st.markdown(cards, unsafe_allow_html=True)
         else:
             st.info("🎉 ¡Excelente! No se detectaron oportunidades críticas de optimización.")
     
@@ -419,21 +488,21 @@ class EcommerceDashboard:
         """Renderizar recomendaciones de escalado"""
         scaling = insights.get('scaling_recommendations', [])
         
+        cards = []
         for rec in scaling[:3]:
-            scale_type = rec.get('type', 'scale_up')
-            icon = "📈" if scale_type == 'scale_up' else "📉"
-            color = "#28a745" if scale_type == 'scale_up' else "#dc3545"
-            
-            st.markdown(f"""
-            <div style='border: 2px solid {color}; background: #f8f9fa; 
-                        padding: 1rem; border-radius: 10px; margin: 1rem 0;'>
-                <h5 style='margin: 0; color: {color};'>{icon} {rec.get("title", "Recomendación")}</h5>
-                <p style='margin: 0.5rem 0;'><strong>Canal:</strong> {rec.get("channel", "N/A")}</p>
-                <p style='margin: 0.5rem 0;'><strong>ROAS Actual:</strong> {rec.get("current_roas", 0):.1f}x</p>
-                <p style='margin: 0.5rem 0;'><strong>Acción:</strong> {rec.get("recommended_action", "")}</p>
-                <p style='margin: 0; color: #28a745;'><strong>Impacto:</strong> {rec.get("expected_impact", "")}</p>
-            </div>
-            """, unsafe_allow_html=True)
+            scale_up = rec.get('type', 'scale_up') == 'scale_up'
+            cards.append(_SCALING_TEMPLATE.format(
+                color="#28a745" if scale_up else "#dc3545",
+                icon="📈" if scale_up else "📉",
+                title=rec.get("title", "Recomendación"),
+                channel=rec.get("channel", "N/A"),
+                current_roas=rec.get("current_roas", 0),
+                action=rec.get("recommended_action", ""),
+                impact=rec.get("expected_impact", "")
+            ).strip())
+        
+        if cards:
+            st.markdown('\n'.join(cards), unsafe_allow_html=True)
     
     def _render_product_insights(self, insights):
         """Renderizar insights específicos de productos"""
@@ -461,46 +530,35 @@ class EcommerceDashboard:
             }
         ]
         
-        for insight in product_insights:
-            with st.expander(f"💡 {insight['product']}", expanded=True):
-                st.write(f"**Análisis:** {insight['insight']}")
-                st.write(f"**Recomendación:** {insight['recommendation']}")
-                st.success(f"**Impacto:** {insight['impact']}")
+        st.markdown(
+            '\n'.join(_PRODUCT_INSIGHT_TEMPLATE.format_map(insight).strip() for insight in product_insights),
+            unsafe_allow_html=True
+        )
     
     def _render_audience_insights(self, insights):
         """Renderizar insights de audiencias"""
         audience_data = insights.get('audience_insights', [])
         
         if audience_data:
-            for audience in audience_data[:3]:
-                performance = audience.get('performance_rating', 'regular')
-                
-                # Color basado en performance
-                colors = {
-                    'excelente': '#28a745',
-                    'bueno': '#17a2b8',
-                    'regular': '#ffc107',
-                    'bajo': '#dc3545'
-                }
-                
-                color = colors.get(performance, '#ffc107')
-                
-                st.markdown(f"""
-                <div style='border-left: 4px solid {color}; background: #f8f9fa; 
-                            padding: 1rem; border-radius: 5px; margin: 1rem 0;'>
-                    <h6 style='margin: 0; color: #333;'>{audience.get("audience_name", "Audiencia")}</h6>
-                    <p style='margin: 0.3rem 0;'><strong>ROAS:</strong> {audience.get("roas", 0):.1f}x</p>
-                    <p style='margin: 0.3rem 0;'><strong>% Presupuesto:</strong> {audience.get("spend_percentage", 0):.1f}%</p>
-                    <p style='margin: 0; color: {color}; font-weight: bold;'>
-                        {audience.get("recommendation", "Mantener configuración actual")}
-                    </p>
-                </div>
-                """, unsafe_allow_html=True)
+            cards = '\n'.join(
+                _AUDIENCE_TEMPLATE.format(
+                    # Color basado en performance
+                    color=_AUDIENCE_COLORS.get(audience.get('performance_rating', 'regular'), '#ffc107'),
+                    name=audience.get("audience_name", "Audiencia"),
+                    roas=audience.get("roas", 0),
+                    spend_percentage=audience.get("spend_percentage", 0),
+                    recommendation=audience.get("recommendation", "Mantener configuración actual")
+                ).strip()
+                for audience in audience_data[:3]
+            )
+            st.markdown(cards, unsafe_allow_html=True)
         else:
             st.info("Conecta tus fuentes de datos publicitarios para ver insights de audiencias")
     
     def _render_demo_revenue_chart(self):
         """Renderizar gráfico demo de revenue"""
+        import plotly.express as px
+        
         dates = pd.date_range(start=datetime.now() - timedelta(days=30), end=datetime.now(), freq='D')
         revenue = np.random.uniform(1000, 4000, len(dates))
         
@@ -517,6 +575,8 @@ class EcommerceDashboard:
     
     def _render_demo_channel_chart(self):
         """Renderizar gráfico demo de canales"""
+        import plotly.graph_objects as go
+        
         channels = ['Meta Ads', 'Google Ads', 'Email', 'Organic']
         revenue = [18000, 9600, 3200, 1200]
         spend = [4500, 3200, 800, 0]
@@ -535,6 +595,8 @@ class EcommerceDashboard:
     
     def _render_demo_roas_chart(self):
         """Renderizar gráfico demo de ROAS"""
+        import plotly.graph_objects as go
+        
         channels = ['Meta Ads', 'Google Ads', 'Email', 'Organic']
         roas = [4.0, 3.0, 4.0, float('inf')]
         roas_display = [4.0, 3.0, 4.0, 5.0]  # Para visualización
@@ -553,6 +615,8 @@ class EcommerceDashboard:
     
     def _render_demo_funnel_chart(self):
         """Renderizar gráfico demo de funnel"""
+        import plotly.graph_objects as go
+        
         stages = ['Impresiones', 'Clics', 'Visitas', 'Conversiones']
         values = [100000, 5000, 3500, 250]
         
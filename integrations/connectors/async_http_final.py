@@ -0,0 +1,105 @@
+# integrations/connectors/async_http.py
+import asyncio
+import hashlib
+import json
+import os
+import tempfile
+import threading
+import time
+
+# Caché en disco opcional (diskcache) para respuestas de la API: sobrevive a reinicios
+RESPONSE_TTL = 600
+RESPONSE_BUCKET = 300
+_response_caches = {}
+
+# Un único event loop por proceso, en un hilo de fondo, compartido por todos los
+# conectores: las instancias son por sesión y no deben arrancar hilos propios
+_loop = None
+_loop_lock = threading.Lock()
+_session = None
+
+def get_loop():
+    """Event loop del proceso, creado la primera vez que se necesita"""
+    global _loop
+    if _loop is None:
+        with _loop_lock:
+            if _loop is None:
+                loop = asyncio.new_event_loop()
+                threading.Thread(target=loop.run_forever, name='connectors-http', daemon=True).start()
+                _loop = loop
+    return _loop
+
+def run(coro):
+    """Ejecutar una corrutina en el loop compartido y esperar su resultado"""
+    return asyncio.run_coroutine_threadsafe(coro, get_loop()).result()
+
+async def get_session():
+    """Sesión aiohttp (pool keep-alive) compartida; las credenciales van por petición"""
+    import aiohttp
+    
+    global _session
+    if _session is None or _session.closed:
+        connector = aiohttp.TCPConnector(limit=20, limit_per_host=10, ttl_dns_cache=300)
+        _session = aiohttp.ClientSession(
+            connector=connector,
+            timeout=aiohttp.ClientTimeout(total=30)
+        )
+    return _session
+
+def get_response_cache(name):
+    """Abrir la caché en disco indicada la primera vez; None si diskcache no está instalado"""
+    if name not in _response_caches:
+        try:
+            import diskcache
+        except ImportError:
+            _response_caches[name] = None
+        else:
+            _response_caches[name] = diskcache.Cache(
+                os.path.join(tempfile.gettempdir(), name),
+                size_limit=512 << 20
+            )
+    return _response_caches[name]
+
+def response_key(*parts):
+    """Clave (tienda, credencial, endpoint, params, franja de 5 min)"""
+    bucket = int(time.time() // RESPONSE_BUCKET)
+    raw = json.dumps([*parts, bucket], sort_keys=True, default=str)
+    return hashlib.blake2b(raw.encode(), digest_size=16).hexdigest()
+
+def is_retryable(exc):
+    """429, 5xx transitorios y fallos de red se reintentan; el resto no"""
+    import aiohttp
+    
+    if isinstance(exc, aiohttp.ClientResponseError):
+        return exc.status in (429, 502, 503, 504)
+    return isinstance(exc, (aiohttp.ClientConnectionError, asyncio.TimeoutError))
+
+def retry_after_seconds(exc):
+    """Segundos indicados por Retry-After en un 429; None si no aplica"""
+    import aiohttp
+    
+    if isinstance(exc, aiohttp.ClientResponseError) and exc.status == 429 and exc.headers:
+        try:
+            return float(exc.headers.get('Retry-After', 1))
+        except ValueError:
+            return None
+    return None
+
+def retrying():
+    """Política de reintentos de las llamadas salientes"""
+    from tenacity import AsyncRetrying, retry_if_exception, stop_after_attempt, wait_exponential_jitter
+    
+    backoff = wait_exponential_jitter(initial=0.5, max=10)
+    
+    # Retry-After en un 429, backoff exponencial en el resto. Tenacity espera entre
+    # intentos, fuera del cuerpo del intento: quien espera no retiene el limitador
+    def wait(retry_state):
+        retry_after = retry_after_seconds(retry_state.outcome.exception())
+        return retry_after if retry_after is not None else backoff(retry_state)
+    
+    return AsyncRetrying(
+        retry=retry_if_exception(is_retryable),
+        stop=stop_after_attempt(5),
+        wait=wait,
+        reraise=True
+    )
@@ -1,22 +1,218 @@
 # integrations/connectors/meta_connector.py
-import streamlit as st
-import pandas as pd
-import numpy as np
-import requests
 from datetime import datetime, timedelta
+from collections import OrderedDict
+from concurrent.futures import Future
+from functools import lru_cache
+from dataclasses import dataclass
+from typing import Optional
+from urllib.parse import urlencode
+import threading
+import hashlib
+import secrets
 import json
 
+try:
+    import orjson
+    _json_dumps = orjson.dumps
+    _json_loads = orjson.loads
+except ImportError:
+    # orjson es opcional; json de la librería estándar como respaldo
+    def _json_dumps(obj):
+        return json.dumps(obj).encode('utf-8')
+    _json_loads = json.loads
+
+GRAPH_API_URL = "https://graph.facebook.com/v18.0"
+
+# Multiplicadores por día de la semana (lunes=0 ... domingo=6)
+WEEKDAY_CONV_MULT = (1.2, 1.2, 1.2, 1.2, 1.2, 1.0, 1.0)
+WEEKDAY_VAL_MULT = (1.15, 1.15, 1.15, 1.15, 1.15, 1.0, 1.0)
+
+@lru_cache(maxsize=None)
+def _weekday_multipliers():
+    """Arrays de multiplicadores, construidos una sola vez al primer uso"""
+    import numpy as np
+    return (
+        np.array(WEEKDAY_CONV_MULT, dtype=np.float32),
+        np.array(WEEKDAY_VAL_MULT, dtype=np.float32)
+    )
+
+class FacebookBatchQueue:
+    """Agrupa peticiones a Graph API y las envía como un único POST batch"""
+    
+    def __init__(self, access_token, delay_ms=50, max_batch=50, max_retries=3,
+                 backoff=1.0, should_retry=None):
+        import requests
+        self.access_token = access_token
+        self.delay = delay_ms / 1000
+        self.max_batch = max_batch
+        self.max_retries = max_retries
+        self.backoff = backoff
+        # Error #613: límite de llamadas alcanzado
+        self.should_retry = should_retry or (lambda error: error.get('code') == 613)
+        self._session = requests.Session()
+        self._pending = []
+        self._timer = None
+        self._lock = threading.Lock()
+    
+    def push(self, relative_url, method='GET', body=None):
+        """Encolar una petición; devuelve un Future con {'code', 'body'}"""
+        request = {'method': method, 'relative_url': relative_url}
+        if body:
+            request['body'] = urlencode(body)
+        
+        future = Future()
+        self._enqueue(request, future, 0)
+        return future
+    
+    def flush(self):
+        """Enviar inmediatamente las peticiones pendientes"""
+        with self._lock:
+            batch = self._take_batch()
+        if batch:
+            self._send(batch)
+    
+    def _enqueue(self, request, future, attempt):
+        with self._lock:
+            self._pending.append((request, future, attempt))
+            if len(self._pending) < self.max_batch:
+                if self._timer is None:
+                    self._schedule_flush()
+                return
+            batch = self._take_batch()
+        self._send(batch)
+    
+    def _schedule_flush(self):
+        self._timer = threading.Timer(self.delay, self.flush)
+        self._timer.daemon = True
+        self._timer.start()
+    
+    def _take_batch(self):
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+        
+        batch = self._pending[:self.max_batch]
+        self._pending = self._pending[self.max_batch:]
+        if self._pending:
+            self._schedule_flush()
+        return batch
+    
+    def _send(self, batch):
+        try:
+            payload = _json_dumps({
+                'access_token': self.access_token,
+                'batch': [request for request, _, _ in batch]
+            })
+            response = self._session.post(
+                GRAPH_API_URL,
+                data=payload,
+                headers={'Content-Type': 'application/json'},
+                timeout=10
+            )
+            response.raise_for_status()
+            results = _json_loads(response.content)
+        except Exception as e:
+            for _, future, _ in batch:
+                future.set_exception(e)
+            return
+        
+        if not isinstance(results, list):
+            results = []
+        
+        # Graph devuelve las respuestas en el mismo orden que el batch
+        for (request, future, attempt), result in zip(batch, results):
+            try:
+                self._resolve(request, future, attempt, result)
+            except Exception as e:
+                # Una respuesta malformada no debe dejar futures sin resolver
+                if not future.done():
+                    future.set_exception(e)
+        
+        # Respuestas que Graph no devolvió: fallar rápido en lugar de esperar al timeout
+        for _, future, _ in batch[len(results):]:
+            future.set_exception(RuntimeError("Graph API no devolvió respuesta para la petición"))
+    
+    def _resolve(self, request, future, attempt, result):
+        """Resolver (o reintentar) una petición con su respuesta del batch"""
+        body = _json_loads(result['body']) if result and result.get('body') else {}
+        error = body.get('error') if isinstance(body, dict) else None
+        
+        # Las respuestas nulas (timeout interno de Graph) también se reintentan
+        retry = result is None or (error is not None and self.should_retry(error))
+        if retry and attempt < self.max_retries:
+            timer = threading.Timer(
+                self.backoff * 2 ** attempt,
+                self._enqueue,
+                args=(request, future, attempt + 1)
+            )
+            timer.daemon = True
+            timer.start()
+        elif result is None:
+            future.set_exception(RuntimeError("Graph API no respondió a la petición"))
+        else:
+            future.set_result({'code': result['code'], 'body': body})
+
+def _token_hash(token):
+    """Hash corto del token para usarlo como clave sin guardar el secreto"""
+    return hashlib.blake2b((token or '').encode(), digest_size=8).hexdigest()
+
+# Colas por hash de token (LRU): los tokens no quedan como claves de un dict
+# global y las colas de tokens que ya no se usan se descartan
+_MAX_BATCH_QUEUES = 64
+_batch_queues = OrderedDict()
+_batch_queues_lock = threading.Lock()
+
+def get_batch_queue(access_token):
+    """Obtener la cola batch compartida para un token"""
+    key = _token_hash(access_token)
+    with _batch_queues_lock:
+        queue = _batch_queues.get(key)
+        if queue is None:
+            queue = _batch_queues[key] = FacebookBatchQueue(access_token)
+            if len(_batch_queues) > _MAX_BATCH_QUEUES:
+                _batch_queues.popitem(last=False)
+        else:
+            _batch_queues.move_to_end(key)
+        return queue
+
+@lru_cache(maxsize=1)
+def _ad_accounts_cache():
+    """Consulta de cuentas cacheada 10 minutos por token (streamlit se importa al primer uso)"""
+    import streamlit as st
+    
+    @st.cache_data(ttl=600, show_spinner=False)
+    def _ad_accounts(token_hash, _connector):
+        return _connector._graph_get('me/adaccounts?fields=id,name')['data']
+    
+    return _ad_accounts
+
+@dataclass
+class MetaSessionState:
+    """Estado de Meta Ads guardado bajo una sola clave de st.session_state"""
+    access_token: Optional[str] = None
+    system_token: Optional[str] = None
+    business_id: Optional[str] = None
+    app_id: Optional[str] = None
+    ad_account_id: Optional[str] = None
+    auth_method: Optional[str] = None
+    connected: bool = False
+    last_sync: Optional[str] = None
+
 class MetaConnector:
+    # Constantes compartidas por todas las instancias
+    name = "Meta Ads (Facebook/Instagram)"
+    color = "#1877F2"
+    icon = "📘"
+    base_url = GRAPH_API_URL
+    
     def __init__(self):
-        self.name = "Meta Ads (Facebook/Instagram)"
-        self.color = "#1877F2"
-        self.icon = "📘"
         self.access_token = None
         self.ad_account_id = None
-        self.base_url = "https://graph.facebook.com/v18.0"
+        self._connected_cache = None
     
     def configure(self):
         """Configuración visual del conector Meta Ads"""
+        import streamlit as st
         st.subheader("🔗 Configurar Meta Ads")
         
         with st.container():
@@ -63,6 +259,7 @@ class MetaConnector:
                     
                     if access_token:
                         self.access_token = access_token
+                        self._connected_cache = None
                         if st.button("🔍 Verificar Token"):
                             if self._verify_token():
                                 st.success("✅ Token válido")
@@ -108,26 +305,29 @@ class MetaConnector:
                 # Mostrar cuentas disponibles
                 if self.is_connected():
                     st.write("### Cuentas Disponibles")
-                    accounts = self._get_ad_accounts()
-                    for account in accounts:
-                        st.write(f"- {account['name']} ({account['id']})")
+                    try:
+                        accounts = self._get_ad_accounts()
+                    except Exception as e:
+                        st.error(f"No se pudieron obtener las cuentas publicitarias: {e}")
+                    else:
+                        for account in accounts:
+                            st.write(f"- {account['name']} ({account['id']})")
         
         # Botón guardar
         if self.is_connected():
             if st.button("💾 Guardar Configuración", type="primary"):
-                config = {
-                    'app_id': app_id,
-                    'ad_account_id': self.ad_account_id,
-                    'access_token': self.access_token,
-                    'auth_method': auth_method,
-                    'connected': True,
-                    'last_sync': datetime.now().isoformat()
-                }
-                st.session_state['connector_meta'] = config
+                meta = self._session_state()
+                meta.app_id = app_id
+                meta.ad_account_id = self.ad_account_id
+                meta.access_token = meta.access_token or self.access_token
+                meta.auth_method = auth_method
+                meta.connected = True
+                meta.last_sync = datetime.now().isoformat()
                 st.success("✅ Configuración guardada correctamente")
     
     def _configure_campaigns(self):
         """Configurar campañas específicas"""
+        import streamlit as st
         st.write("#### Selecciona qué datos trackear:")
         
         col1, col2, col3 = st.columns(3)
@@ -192,8 +392,16 @@ class MetaConnector:
             }
         }
     
+    def _session_state(self):
+        """Obtener (o crear) el estado de Meta en st.session_state"""
+        import streamlit as st
+        if 'meta' not in st.session_state:
+            st.session_state['meta'] = MetaSessionState()
+        return st.session_state['meta']
+    
     def _generate_oauth_url(self, app_id):
         """Generar URL de OAuth para Meta"""
+        import streamlit as st
         base_url = "https://www.facebook.com/v18.0/dialog/oauth"
         redirect_uri = st.secrets.get('META_REDIRECT_URI', 'http://localhost:8501')
         scope = "ads_read,read_insights,business_management"
@@ -202,10 +410,12 @@ class MetaConnector:
     
     def _handle_oauth_callback(self, code, app_id, app_secret):
         """Manejar callback de OAuth"""
+        import streamlit as st
         try:
             # Simular intercambio de código por token
-            self.access_token = f"demo_token_{datetime.now().strftime('%Y%m%d%H%M%S')}"
-            st.session_state['meta_access_token'] = self.access_token
+            self.access_token = f"demo_token_{secrets.token_hex(8)}"
+            self._session_state().access_token = self.access_token
+            self._connected_cache = None
             return True
         except Exception as e:
             st.error(f"Error en OAuth: {str(e)}")
@@ -213,24 +423,44 @@ class MetaConnector:
     
     def _setup_business_manager(self, business_id, system_user_token):
         """Configurar Business Manager"""
+        import streamlit as st
         try:
-            st.session_state['meta_business_id'] = business_id
-            st.session_state['meta_system_token'] = system_user_token
+            meta = self._session_state()
+            meta.business_id = business_id
+            meta.system_token = system_user_token
             self.access_token = system_user_token
+            self._connected_cache = None
             st.success("Business Manager configurado correctamente")
         except Exception as e:
             st.error(f"Error al configurar Business Manager: {str(e)}")
     
+    def _is_demo_token(self):
+        """Los tokens demo no se envían a Graph API"""
+        return self.access_token is None or self.access_token.startswith('demo_token_')
+    
+    def _graph_get(self, relative_url, timeout=5):
+        """GET a Graph API a través de la cola batch compartida"""
+        result = get_batch_queue(self.access_token).push(relative_url).result(timeout=timeout)
+        if result['code'] != 200:
+            error = result['body'].get('error', {}) if isinstance(result['body'], dict) else {}
+            raise RuntimeError(error.get('message', f"Graph API respondió {result['code']}"))
+        return result['body']
+    
     def _verify_token(self):
         """Verificar validez del token"""
         try:
-            # Simular verificación de token
-            return len(self.access_token) > 20 if self.access_token else False
+            if self._is_demo_token():
+                # Simular verificación de token
+                return len(self.access_token) > 20 if self.access_token else False
+            return 'id' in self._graph_get('me?fields=id')
         except:
             return False
     
     def _get_ad_accounts(self):
-        """Obtener cuentas publicitarias"""
+        """Obtener cuentas publicitarias (los errores de Graph API se propagan)"""
+        if not self._is_demo_token():
+            return _ad_accounts_cache()(_token_hash(self.access_token), self)
+        
         return [
             {'id': 'act_123456789', 'name': 'Cuenta Principal'},
             {'id': 'act_987654321', 'name': 'Cuenta Secundaria'},
@@ -238,14 +468,21 @@ class MetaConnector:
     
     def is_connected(self):
         """Verificar si está conectado"""
-        return (
-            'meta_access_token' in st.session_state or 
-            'meta_system_token' in st.session_state or
-            self.access_token is not None
-        )
+        import streamlit as st
+        # Se calcula una vez y se invalida cuando cambia el token
+        if self._connected_cache is None:
+            meta = st.session_state.get('meta')
+            self._connected_cache = (
+                bool(meta and (meta.access_token or meta.system_token)) or
+                self.access_token is not None
+            )
+        return self._connected_cache
     
     def fetch_data(self, date_range=30):
         """Obtener datos de Meta Ads"""
+        import streamlit as st
+        import pandas as pd
+        import numpy as np
         if not self.is_connected():
             return None
         
@@ -272,16 +509,21 @@ class MetaConnector:
             
             df = pd.DataFrame(data)
             
-            # Calcular métricas derivadas
-            df['conversion_rate'] = (df['conversions'] / df['clicks']) * 100
-            df['roas'] = df['conversion_value'] / df['spend']
-            df['cost_per_conversion'] = df['spend'] / df['conversions']
+            # Calcular métricas derivadas en un solo bloque, sin divisiones por cero
+            clicks = df['clicks'].to_numpy()
+            spend = df['spend'].to_numpy()
+            conversions = df['conversions'].to_numpy()
+            conversion_value = df['conversion_value'].to_numpy()
+            with np.errstate(divide='ignore', invalid='ignore'):
+                df['conversion_rate'] = np.where(clicks > 0, conversions / clicks * 100.0, 0.0)
+                df['roas'] = np.where(spend > 0, conversion_value / spend, 0.0)
+                df['cost_per_conversion'] = np.where(conversions > 0, spend / conversions, 0.0)
             
             # Agregar tendencias (mejor performance en weekdays)
-            for i, row in df.iterrows():
-                if row['date'].weekday() < 5:  # Lunes a viernes
-                    df.at[i, 'conversions'] *= 1.2
-                    df.at[i, 'conversion_value'] *= 1.15
+            conv_mult, val_mult = _weekday_multipliers()
+            weekdays = dates.weekday.to_numpy()
+            df['conversions'] = conversions * conv_mult[weekdays]
+            df['conversion_value'] = conversion_value * val_mult[weekdays]
             
             return df
             
@@ -291,6 +533,7 @@ class MetaConnector:
     
     def get_summary_metrics(self):
         """Obtener métricas resumen"""
+        import numpy as np
         df = self.fetch_data(30)
         if df is None:
             return {}
@@ -313,6 +556,8 @@ class MetaConnector:
     
     def get_campaign_performance(self, limit=10):
         """Obtener rendimiento por campaña"""
+        import pandas as pd
+        import numpy as np
         campaigns = [
             'Campaña Awareness - Q4', 'Retargeting - Cart Abandoners', 
             'Lookalike Audiences', 'Interest Targeting - Premium',
@@ -320,25 +565,26 @@ class MetaConnector:
             'Traffic Campaign - Blog', 'Lead Generation - Newsletter'
         ]
         
-        data = []
-        for campaign in campaigns[:limit]:
-            spend = np.random.uniform(100, 2000)
-            conversions = np.random.randint(10, 150)
-            conversion_value = conversions * np.random.uniform(15, 80)
-            
-            data.append({
-                'campaign_name': campaign,
-                'impressions': np.random.randint(5000, 80000),
-                'clicks': np.random.randint(100, 2000),
-                'spend': round(spend, 2),
-                'conversions': conversions,
-                'conversion_value': round(conversion_value, 2),
-                'roas': round(conversion_value / spend, 2),
-                'ctr': round(np.random.uniform(1.0, 5.0), 2),
-                'cpc': round(np.random.uniform(0.5, 4.0), 2)
-            })
+        selected = campaigns[:limit]
+        n = len(selected)
+        
+        spend = np.random.uniform(100, 2000, n)
+        conversions = np.random.randint(10, 150, n)
+        conversion_value = conversions * np.random.uniform(15, 80, n)
+        
+        df = pd.DataFrame({
+            'campaign_name': selected,
+            'impressions': np.random.randint(5000, 80000, n),
+            'clicks': np.random.randint(100, 2000, n),
+            'spend': np.round(spend, 2),
+            'conversions': conversions,
+            'conversion_value': np.round(conversion_value, 2),
+            'roas': np.round(conversion_value / spend, 2),
+            'ctr': np.round(np.random.uniform(1.0, 5.0, n), 2),
+            'cpc': np.round(np.random.uniform(0.5, 4.0, n), 2)
+        })
         
-        return sorted(data, key=lambda x: x['roas'], reverse=True)
+        return df.sort_values('roas', ascending=False).to_dict('records')
     
     def get_audience_insights(self):
         """Obtener insights de audiencia"""
@@ -373,12 +619,18 @@ class MetaConnector:
             return False, "No hay token de acceso configurado"
         
         try:
-            # Simular test de conexión
-            test_data = self.fetch_data(7)
-            if test_data is not None and not test_data.empty:
-                return True, "Conexión exitosa a Meta Ads"
-            else:
-                return False, "No se pudieron obtener datos"
+            if self.access_token is None:
+                meta = self._session_state()
+                self.access_token = meta.access_token or meta.system_token
+            
+            # Tokens demo: basta con validar el token, sin generar datos
+            if self._is_demo_token():
+                if self._verify_token():
+                    return True, "Conexión exitosa a Meta Ads"
+                return False, "Token de acceso inválido"
+            
+            # Sonda ligera contra Graph API en lugar de descargar datos
+            self._graph_get('me?fields=id', timeout=3)
+            return True, "Conexión exitosa a Meta Ads"
         except Exception as e:
             return False, f"Error en la conexión: {str(e)}"
-                '
\ No newline at end of file
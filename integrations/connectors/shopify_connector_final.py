@@ -2,9 +2,338 @@
 import streamlit as st
 import pandas as pd
 import numpy as np
+import pyarrow as pa
 import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
 from datetime import datetime, timedelta
-import json
+import re
+import hashlib
+import asyncio
+import threading
+from operator import itemgetter
+from functools import lru_cache
+from integrations.connectors import async_http
+
+# Tienda, pedidos y número de productos en un único documento GraphQL. Las páginas
+# siguientes de pedidos repiten la consulta con withShop=false.
+STORE_SNAPSHOT_QUERY = """
+query StoreSnapshot($ordersQuery: String!, $after: String, $withShop: Boolean!) {
+  shop @include(if: $withShop) {
+    name
+    currencyCode
+    myshopifyDomain
+    ianaTimezone
+    plan { displayName }
+    billingAddress { countryCodeV2 }
+  }
+  orders(first: 250, after: $after, query: $ordersQuery) {
+    edges {
+      node {
+        createdAt
+        totalPriceSet { shopMoney { amount } }
+        customer { id }
+      }
+    }
+    pageInfo { hasNextPage endCursor }
+  }
+  productsCount(limit: null) @include(if: $withShop) {
+    count
+  }
+}
+"""
+
+# Formato de los tokens de Admin API (shpat_ + 32 caracteres o más)
+_SHPAT_RE = re.compile(r'^shpat_[A-Za-z0-9]{32,}$')
+
+# Sesión HTTP compartida (keep-alive) para los endpoints REST que no cubre GraphQL
+_SESSION = requests.Session()
+_SESSION.mount('https://', HTTPAdapter(
+    pool_connections=20,
+    pool_maxsize=50,
+    max_retries=Retry(total=3, backoff_factor=0.5, status_forcelist=[429, 502, 503, 504])
+))
+
+SHOPIFY_DTYPES = {
+    'orders': np.int32,
+    'units_sold': np.int32,
+    'new_customers': np.int32,
+    'returning_customers': np.int32,
+    'total_customers': np.int32,
+    'sales': np.float32,
+    'average_order_value': np.float32,
+    'refunds': np.float32,
+    'shipping_revenue': np.float32,
+    'tax_collected': np.float32,
+    'conversion_rate': np.float32,
+    'refund_rate': np.float32,
+    'net_sales': np.float32
+}
+
+SHOPIFY_PRODUCT_NAMES = (
+    'Premium T-Shirt', 'Wireless Headphones', 'Eco Water Bottle',
+    'Smart Watch', 'Organic Coffee Beans', 'Yoga Mat Pro',
+    'LED Desk Lamp', 'Bluetooth Speaker', 'Canvas Tote Bag',
+    'Protein Powder', 'Running Shoes', 'Skincare Set'
+)
+
+# Límite de la Admin API: ~2 peticiones por segundo por tienda. Los conectores son
+# por sesión, así que el semáforo y el limitador se comparten por tienda en el proceso.
+# Solo se tocan desde el loop compartido de async_http: no necesitan lock.
+_shop_limiters = {}
+
+def _shop_limits(shop_url):
+    """(limitador, semáforo) de la tienda, creados en el loop compartido al primer uso"""
+    from aiolimiter import AsyncLimiter
+    
+    limits = _shop_limiters.get(shop_url)
+    if limits is None:
+        limits = _shop_limiters[shop_url] = (
+            AsyncLimiter(max_rate=2, time_period=1),
+            asyncio.Semaphore(10)
+        )
+    return limits
+
+# Los datos se cachean por token (hasheado) para que cada tienda tenga su entrada
+def _token_hash(token):
+    """Hash corto del token para usarlo como clave de caché sin guardar el secreto"""
+    return hashlib.blake2b((token or '').encode(), digest_size=8).hexdigest()
+
+def _shop_seed(shop_url):
+    """Semilla estable por tienda: los datos demo se repiten entre procesos"""
+    return int.from_bytes(hashlib.blake2b((shop_url or '').encode(), digest_size=4).digest(), 'little')
+
+# Rangos [min, max) de las columnas demo: 4 conteos seguidos de 6 decimales
+_DEMO_LOW = np.array([10, 25, 5, 8, 800, 45, 50, 80, 60, 2.1])
+_DEMO_SPAN = np.array([45, 120, 25, 35, 3500, 120, 300, 250, 280, 5.8]) - _DEMO_LOW
+_DATE_AXIS_DAYS = 366
+
+# Buffer de trabajo por hilo: cada script run de Streamlit reutiliza el suyo
+_scratch = threading.local()
+
+def _scratch_buffer(n):
+    """Devolver un bloque (n, 10) reutilizable del hilo actual"""
+    buf = getattr(_scratch, 'buf', None)
+    if buf is None or len(buf) < n:
+        buf = _scratch.buf = np.empty((max(n, _DATE_AXIS_DAYS), len(_DEMO_LOW)))
+    return buf[:n]
+
+def _apply_weekend_uplift(df, col_factors):
+    """Multiplicar columnas los sábados y domingos con una máscara (nunca iterrows)"""
+    mask = df['date'].dt.dayofweek.values >= 5
+    for col, factor in col_factors.items():
+        df.loc[mask, col] = df.loc[mask, col] * factor
+
+@lru_cache(maxsize=1)
+def _date_axis(today):
+    """Eje diario del último año, construido una vez por día"""
+    return pd.date_range(end=today, periods=_DATE_AXIS_DAYS, freq='D')
+
+@st.cache_data(ttl=24 * 60 * 60, show_spinner=False)
+def _fetch_shopify(date_range, token_hash, seed):
+    """Generar el DataFrame diario de Shopify"""
+    # Generar datos demo realistas para Shopify
+    n = date_range + 1
+    if n <= _DATE_AXIS_DAYS:
+        dates = _date_axis(pd.Timestamp.today().normalize())[-n:]
+    else:
+        dates = pd.date_range(end=pd.Timestamp.today().normalize(), periods=n, freq='D')
+    
+    # Una sola extracción sobre el buffer reutilizable, escalada en sitio
+    rng = np.random.default_rng(seed)
+    buf = _scratch_buffer(n)
+    rng.random(out=buf)
+    buf *= _DEMO_SPAN
+    buf += _DEMO_LOW
+    np.floor(buf[:, :4], out=buf[:, :4])
+    ints, floats = buf[:, :4], buf[:, 4:]
+    sales, refunds = floats[:, 0], floats[:, 2]
+    
+    # Calcular métricas derivadas sobre los arrays, antes de construir el DataFrame
+    total_customers = ints[:, 2] + ints[:, 3]
+    refund_rate = np.divide(refunds, sales, out=np.zeros_like(sales), where=sales != 0) * 100
+    net_sales = sales - refunds
+    
+    df = pd.DataFrame({
+        'date': dates,
+        'orders': ints[:, 0],
+        'sales': sales,
+        'units_sold': ints[:, 1],
+        'average_order_value': floats[:, 1],
+        'new_customers': ints[:, 2],
+        'returning_customers': ints[:, 3],
+        'refunds': refunds,
+        'shipping_revenue': floats[:, 3],
+        'tax_collected': floats[:, 4],
+        'total_customers': total_customers,
+        'conversion_rate': floats[:, 5],
+        'refund_rate': refund_rate,
+        'net_sales': net_sales
+    }, copy=False)
+    
+    # Simular patrones de fin de semana (más ventas)
+    _apply_weekend_uplift(df, {'orders': 1.3, 'sales': 1.25, 'units_sold': 1.2})
+    
+    # Conteos y montos caben en 32 bits (el cast a int32 trunca los conteos)
+    df = df.astype(SHOPIFY_DTYPES)
+    
+    # Columnas respaldadas por Arrow: Streamlit las envía al frontend sin otra conversión
+    # (DataProcessor las pasa a numpy en _standardize_data_format)
+    return pa.Table.from_pandas(df, preserve_index=False).to_pandas(types_mapper=pd.ArrowDtype)
+
+@st.cache_data(ttl=300, show_spinner=False)
+def _summary_metrics(token_hash, seed):
+    """Métricas resumen sobre el mismo DataFrame cacheado que usa el dashboard"""
+    df = _fetch_shopify(30, token_hash, seed)
+    
+    # Una sola pasada de reducción por columna
+    agg = df.agg({
+        'orders': 'sum',
+        'sales': 'sum',
+        'units_sold': 'sum',
+        'average_order_value': 'mean',
+        'total_customers': 'sum',
+        'new_customers': 'sum',
+        'returning_customers': 'sum',
+        'refunds': 'sum',
+        'conversion_rate': 'mean',
+        'net_sales': 'sum'
+    })
+    changes = np.random.default_rng(seed).uniform([-5, -3, -8], [18, 22, 15]).round(1)
+    
+    return {
+        'total_orders': int(agg['orders']),
+        'total_sales': round(float(agg['sales']), 2),
+        'total_units_sold': int(agg['units_sold']),
+        'avg_order_value': round(float(agg['average_order_value']), 2),
+        'total_customers': int(agg['total_customers']),
+        'new_customers': int(agg['new_customers']),
+        'returning_customers': int(agg['returning_customers']),
+        'total_refunds': round(float(agg['refunds']), 2),
+        'avg_conversion_rate': round(float(agg['conversion_rate']), 2),
+        'net_sales': round(float(agg['net_sales']), 2),
+        'sales_change': float(changes[0]),
+        'orders_change': float(changes[1]),
+        'aov_change': float(changes[2])
+    }
+
+@st.cache_data(ttl=24 * 60 * 60, show_spinner=False)
+def _top_products(limit, token_hash, seed):
+    """Generar ranking de productos más vendidos"""
+    n = min(limit, len(SHOPIFY_PRODUCT_NAMES))
+    
+    # Todas las columnas aleatorias de una vez en lugar de por producto
+    rng = np.random.default_rng(seed)
+    units_sold = rng.integers(50, 500, n)
+    prices = rng.uniform(25, 150, n).round(2)
+    revenues = (units_sold * prices).round(2)
+    margins = rng.uniform(25, 65, n).round(1)
+    inventory = rng.integers(10, 200, n)
+    conversion = rng.uniform(2.1, 8.5, n).round(2)
+    
+    data = [
+        {
+            'product_name': product,
+            'units_sold': units,
+            'revenue': revenue,
+            'price': price,
+            'profit_margin': margin,
+            'inventory_level': stock,
+            'conversion_rate': rate
+        }
+        for product, units, revenue, price, margin, stock, rate in zip(
+            SHOPIFY_PRODUCT_NAMES, units_sold.tolist(), revenues.tolist(), prices.tolist(),
+            margins.tolist(), inventory.tolist(), conversion.tolist()
+        )
+    ]
+    
+    return sorted(data, key=itemgetter('revenue'), reverse=True)
+
+# Vista previa de configure(): se evita regenerarla en cada rerun de los inputs.
+# Información, estadísticas y test de conexión comparten un mismo snapshot.
+@st.cache_data(ttl=60, show_spinner=False)
+def _store_snapshot(shop_url, token_hash, _connector):
+    """Snapshot de la tienda (el conector no forma parte de la clave de caché)"""
+    return _connector.fetch_store_snapshot()
+
+@st.cache_data(ttl=60, show_spinner=False)
+def _shop_info(shop_url, token_hash, _connector):
+    """Información de la tienda"""
+    if not _connector._is_demo_token():
+        try:
+            shop = _store_snapshot(shop_url, token_hash, _connector)['shop']
+        except Exception:
+            return None
+        return {
+            'name': shop['name'],
+            'plan': shop['plan']['displayName'],
+            'currency': shop['currencyCode'],
+            'domain': shop['myshopifyDomain'],
+            'country': (shop.get('billingAddress') or {}).get('countryCodeV2'),
+            'timezone': shop['ianaTimezone']
+        }
+    
+    return {
+        'name': 'Mi Tienda Demo',
+        'plan': 'Shopify Plus',
+        'currency': 'USD',
+        'domain': shop_url or 'mi-tienda.myshopify.com',
+        'country': 'US',
+        'timezone': 'America/New_York'
+    }
+
+@st.cache_data(ttl=60, show_spinner=False)
+def _quick_stats(shop_url, token_hash, _connector):
+    """Estadísticas rápidas de la vista previa"""
+    if not _connector._is_demo_token():
+        try:
+            snapshot = _store_snapshot(shop_url, token_hash, _connector)
+        except Exception:
+            return None
+        orders = snapshot['orders']
+        return {
+            'orders': len(orders),
+            'orders_change': None,
+            'sales': int(sum(float(o['totalPriceSet']['shopMoney']['amount']) for o in orders)),
+            'sales_change': None,
+            'customers': len({o['customer']['id'] for o in orders if o['customer']}),
+            'products': snapshot['products_count']
+        }
+    
+    orders, orders_change, sales, sales_change, customers, products = np.random.default_rng(
+        _shop_seed(shop_url)
+    ).integers([150, 5, 15000, 8, 1200, 50], [500, 25, 45000, 28, 3500, 300]).tolist()
+    return {
+        'orders': orders,
+        'orders_change': f"+{orders_change}%",
+        'sales': sales,
+        'sales_change': sales_change,
+        'customers': customers,
+        'products': products
+    }
+
+@st.cache_data(ttl=24 * 60 * 60, show_spinner=False)
+def _customer_analytics(token_hash):
+    """Analytics de clientes"""
+    return {
+        'customer_segments': {
+            'new_customers': {'count': 850, 'percentage': 35, 'avg_order_value': 75},
+            'returning_customers': {'count': 1200, 'percentage': 50, 'avg_order_value': 95},
+            'vip_customers': {'count': 360, 'percentage': 15, 'avg_order_value': 180}
+        },
+        'geographic_distribution': {
+            'United States': {'percentage': 65, 'sales': 28500},
+            'Canada': {'percentage': 15, 'sales': 6800},
+            'United Kingdom': {'percentage': 8, 'sales': 3200},
+            'Australia': {'percentage': 7, 'sales': 2900},
+            'Others': {'percentage': 5, 'sales': 2100}
+        },
+        'customer_lifetime_value': {
+            'average_clv': 245.50,
+            'median_clv': 180.25,
+            'top_10_percent_clv': 850.75
+        }
+    }
 
 class ShopifyConnector:
     def __init__(self):
@@ -13,7 +342,10 @@ class ShopifyConnector:
         self.icon = "🛍️"
         self.shop_url = None
         self.access_token = None
-        self.api_version = "2023-10"
+        # productsCount(limit: null) requiere la API 2024-10 o posterior
+        self.api_version = "2025-01"
+        self._connected_cache = None
+        self._rng = np.random.default_rng()
     
     def configure(self):
         """Configuración visual del conector Shopify"""
@@ -49,6 +381,8 @@ class ShopifyConnector:
                     )
                     
                     if private_token:
+                        if private_token != self.access_token:
+                            self._connected_cache = None
                         self.access_token = private_token
                         if st.button("🔍 Verificar Token"):
                             if self._verify_token():
@@ -108,8 +442,14 @@ class ShopifyConnector:
                 if self.is_connected():
                     st.write("### Estadísticas (30 días)")
                     quick_stats = self._get_quick_stats()
-                    st.metric("Pedidos", quick_stats['orders'], quick_stats['orders_change'])
-                    st.metric("Ventas", f"${quick_stats['sales']:,}", f"{quick_stats['sales_change']}%")
+                    if quick_stats:
+                        sales_change = quick_stats['sales_change']
+                        st.metric("Pedidos", quick_stats['orders'], quick_stats['orders_change'])
+                        st.metric(
+                            "Ventas",
+                            f"${quick_stats['sales']:,}",
+                            f"{sales_change}%" if sales_change is not None else None
+                        )
         
         # Botón guardar
         if self.is_connected():
@@ -204,6 +544,7 @@ class ShopifyConnector:
             # Simular intercambio de código por token
             self.access_token = f"shpat_demo_{datetime.now().strftime('%Y%m%d%H%M%S')}"
             st.session_state['shopify_access_token'] = self.access_token
+            self._connected_cache = None
             return True
         except Exception as e:
             st.error(f"Error en OAuth: {str(e)}")
@@ -214,6 +555,7 @@ class ShopifyConnector:
         try:
             st.session_state['shopify_api_key'] = api_key
             st.session_state['shopify_password'] = password
+            self._connected_cache = None
             st.success("Admin API configurado correctamente")
         except Exception as e:
             st.error(f"Error al configurar Admin API: {str(e)}")
@@ -221,43 +563,55 @@ class ShopifyConnector:
     def _verify_token(self):
         """Verificar validez del token"""
         try:
-            # Simular verificación de token
-            return self.access_token and self.access_token.startswith('shpat_')
+            token = self.access_token
+            if not token or not (_SHPAT_RE.match(token) or token.startswith('shpat_demo_')):
+                return False
+            if self._is_demo_token():
+                return True
+            
+            return self._rest_get('shop.json').ok
         except:
             return False
     
+    def _rest_get(self, endpoint, params=None):
+        """GET a la REST Admin API sobre la sesión compartida"""
+        return _SESSION.get(
+            f"https://{self.shop_url}/admin/api/{self.api_version}/{endpoint}",
+            params=params,
+            headers={'X-Shopify-Access-Token': self.access_token},
+            timeout=(5, 30)
+        )
+    
+    def _is_demo_token(self):
+        """Los tokens demo (o sin tienda configurada) no llaman a la API"""
+        return (
+            not self.access_token or
+            not self.shop_url or
+            self.access_token.startswith('shpat_demo_')
+        )
+    
     def _get_shop_info(self):
         """Obtener información de la tienda"""
         if not self.is_connected():
             return None
         
-        return {
-            'name': 'Mi Tienda Demo',
-            'plan': 'Shopify Plus',
-            'currency': 'USD',
-            'domain': self.shop_url or 'mi-tienda.myshopify.com',
-            'country': 'US',
-            'timezone': 'America/New_York'
-        }
+        return _shop_info(self.shop_url, _token_hash(self.access_token), self)
     
     def _get_quick_stats(self):
         """Obtener estadísticas rápidas"""
-        return {
-            'orders': np.random.randint(150, 500),
-            'orders_change': f"+{np.random.randint(5, 25)}%",
-            'sales': np.random.randint(15000, 45000),
-            'sales_change': np.random.randint(8, 28),
-            'customers': np.random.randint(1200, 3500),
-            'products': np.random.randint(50, 300)
-        }
+        return _quick_stats(self.shop_url, _token_hash(self.access_token), self)
     
     def is_connected(self):
         """Verificar si está conectado"""
-        return (
-            'shopify_access_token' in st.session_state or 
-            'shopify_api_key' in st.session_state or
-            self.access_token is not None
-        )
+        # Solo se memoriza el resultado positivo; se invalida al cambiar credenciales
+        if self._connected_cache is None:
+            connected = (
+                'shopify_access_token' in st.session_state or 
+                'shopify_api_key' in st.session_state or
+                self.access_token is not None
+            )
+            self._connected_cache = connected or None
+        return bool(self._connected_cache)
     
     def fetch_data(self, date_range=30):
         """Obtener datos de Shopify"""
@@ -265,41 +619,7 @@ class ShopifyConnector:
             return None
         
         try:
-            # Generar datos demo realistas para Shopify
-            end_date = datetime.now()
-            start_date = end_date - timedelta(days=date_range)
-            
-            dates = pd.date_range(start=start_date, end=end_date, freq='D')
-            
-            data = {
-                'date': dates,
-                'orders': np.random.randint(10, 45, len(dates)),
-                'sales': np.random.uniform(800, 3500, len(dates)),
-                'units_sold': np.random.randint(25, 120, len(dates)),
-                'average_order_value': np.random.uniform(45, 120, len(dates)),
-                'new_customers': np.random.randint(5, 25, len(dates)),
-                'returning_customers': np.random.randint(8, 35, len(dates)),
-                'refunds': np.random.uniform(50, 300, len(dates)),
-                'shipping_revenue': np.random.uniform(80, 250, len(dates)),
-                'tax_collected': np.random.uniform(60, 280, len(dates))
-            }
-            
-            df = pd.DataFrame(data)
-            
-            # Calcular métricas derivadas
-            df['total_customers'] = df['new_customers'] + df['returning_customers']
-            df['conversion_rate'] = np.random.uniform(2.1, 5.8, len(dates))
-            df['refund_rate'] = (df['refunds'] / df['sales']) * 100
-            df['net_sales'] = df['sales'] - df['refunds']
-            
-            # Simular patrones de fin de semana (más ventas)
-            for i, row in df.iterrows():
-                if row['date'].weekday() >= 5:  # Sábado y domingo
-                    df.at[i, 'orders'] *= 1.3
-                    df.at[i, 'sales'] *= 1.25
-                    df.at[i, 'units_sold'] *= 1.2
-            
-            return df
+            return _fetch_shopify(date_range, _token_hash(self.access_token), _shop_seed(self.shop_url))
             
         except Exception as e:
             st.error(f"Error al obtener datos de Shopify: {str(e)}")
@@ -307,81 +627,29 @@ class ShopifyConnector:
     
     def get_summary_metrics(self):
         """Obtener métricas resumen"""
-        df = self.fetch_data(30)
-        if df is None:
+        if not self.is_connected():
             return {}
         
-        return {
-            'total_orders': int(df['orders'].sum()),
-            'total_sales': round(df['sales'].sum(), 2),
-            'total_units_sold': int(df['units_sold'].sum()),
-            'avg_order_value': round(df['average_order_value'].mean(), 2),
-            'total_customers': int(df['total_customers'].sum()),
-            'new_customers': int(df['new_customers'].sum()),
-            'returning_customers': int(df['returning_customers'].sum()),
-            'total_refunds': round(df['refunds'].sum(), 2),
-            'avg_conversion_rate': round(df['conversion_rate'].mean(), 2),
-            'net_sales': round(df['net_sales'].sum(), 2),
-            'sales_change': round(np.random.uniform(-5, 18), 1),
-            'orders_change': round(np.random.uniform(-3, 22), 1),
-            'aov_change': round(np.random.uniform(-8, 15), 1)
-        }
+        try:
+            return _summary_metrics(_token_hash(self.access_token), _shop_seed(self.shop_url))
+        except Exception as e:
+            st.error(f"Error al obtener datos de Shopify: {str(e)}")
+            return {}
     
     def get_top_products(self, limit=10):
         """Obtener productos más vendidos"""
-        products = [
-            'Premium T-Shirt', 'Wireless Headphones', 'Eco Water Bottle',
-            'Smart Watch', 'Organic Coffee Beans', 'Yoga Mat Pro',
-            'LED Desk Lamp', 'Bluetooth Speaker', 'Canvas Tote Bag',
-            'Protein Powder', 'Running Shoes', 'Skincare Set'
-        ]
-        
-        data = []
-        for product in products[:limit]:
-            units_sold = np.random.randint(50, 500)
-            price = np.random.uniform(25, 150)
-            revenue = units_sold * price
-            
-            data.append({
-                'product_name': product,
-                'units_sold': units_sold,
-                'revenue': round(revenue, 2),
-                'price': round(price, 2),
-                'profit_margin': round(np.random.uniform(25, 65), 1),
-                'inventory_level': np.random.randint(10, 200),
-                'conversion_rate': round(np.random.uniform(2.1, 8.5), 2)
-            })
-        
-        return sorted(data, key=lambda x: x['revenue'], reverse=True)
+        return _top_products(limit, _token_hash(self.access_token), _shop_seed(self.shop_url))
     
     def get_customer_analytics(self):
         """Obtener analytics de clientes"""
-        return {
-            'customer_segments': {
-                'new_customers': {'count': 850, 'percentage': 35, 'avg_order_value': 75},
-                'returning_customers': {'count': 1200, 'percentage': 50, 'avg_order_value': 95},
-                'vip_customers': {'count': 360, 'percentage': 15, 'avg_order_value': 180}
-            },
-            'geographic_distribution': {
-                'United States': {'percentage': 65, 'sales': 28500},
-                'Canada': {'percentage': 15, 'sales': 6800},
-                'United Kingdom': {'percentage': 8, 'sales': 3200},
-                'Australia': {'percentage': 7, 'sales': 2900},
-                'Others': {'percentage': 5, 'sales': 2100}
-            },
-            'customer_lifetime_value': {
-                'average_clv': 245.50,
-                'median_clv': 180.25,
-                'top_10_percent_clv': 850.75
-            }
-        }
+        return _customer_analytics(_token_hash(self.access_token))
     
     def get_abandoned_carts(self):
         """Obtener carritos abandonados"""
         return {
-            'total_abandoned_carts': np.random.randint(150, 400),
-            'abandoned_cart_value': round(np.random.uniform(8500, 15000), 2),
-            'recovery_rate': round(np.random.uniform(12, 28), 1),
+            'total_abandoned_carts': self._rng.integers(150, 400),
+            'abandoned_cart_value': round(self._rng.uniform(8500, 15000), 2),
+            'recovery_rate': round(self._rng.uniform(12, 28), 1),
             'average_time_to_abandon': '14 minutos',
             'top_abandonment_reasons': [
                 {'reason': 'Gastos de envío altos', 'percentage': 35},
@@ -392,6 +660,66 @@ class ShopifyConnector:
             ]
         }
     
+    async def _agraphql(self, session, query, variables):
+        """POST a la Admin API GraphQL"""
+        url = f"https://{self.shop_url}/admin/api/{self.api_version}/graphql.json"
+        cache = async_http.get_response_cache('shopify_cache')
+        if cache is not None:
+            key = async_http.response_key(url, _token_hash(self.access_token), query, variables)
+            cached = cache.get(key)
+            if cached is not None:
+                return cached
+        
+        limiter, semaphore = _shop_limits(self.shop_url)
+        async for attempt in async_http.retrying():
+            with attempt:
+                async with limiter, semaphore:
+                    async with session.post(
+                        url,
+                        json={'query': query, 'variables': variables},
+                        headers={'X-Shopify-Access-Token': self.access_token}
+                    ) as response:
+                        response.raise_for_status()
+                        payload = await response.json()
+        
+        if payload.get('errors'):
+            raise RuntimeError(f"Error GraphQL de Shopify: {payload['errors']}")
+        if cache is not None:
+            cache.set(key, payload['data'], expire=async_http.RESPONSE_TTL)
+        return payload['data']
+    
+    async def _afetch_snapshot(self, date_range):
+        session = await async_http.get_session()
+        since = (datetime.now() - timedelta(days=date_range)).strftime('%Y-%m-%d')
+        variables = {'ordersQuery': f"created_at:>={since}", 'after': None, 'withShop': True}
+        
+        data = await self._agraphql(session, STORE_SNAPSHOT_QUERY, variables)
+        snapshot = {
+            'shop': data['shop'],
+            'products_count': data['productsCount']['count'],
+            'orders': []
+        }
+        
+        # Paginación por cursor (modelo de conexiones Relay)
+        orders = data['orders']
+        while True:
+            snapshot['orders'].extend(edge['node'] for edge in orders['edges'])
+            if not orders['pageInfo']['hasNextPage']:
+                break
+            variables = {**variables, 'after': orders['pageInfo']['endCursor'], 'withShop': False}
+            orders = (await self._agraphql(session, STORE_SNAPSHOT_QUERY, variables))['orders']
+        
+        return snapshot
+    
+    def fetch_store_snapshot(self, date_range=30):
+        """Tienda, pedidos y número de productos en una sola consulta GraphQL"""
+        return async_http.run(self._afetch_snapshot(date_range))
+    
+    def disconnect(self):
+        """Olvidar las credenciales (la sesión HTTP es compartida por el proceso)"""
+        self.access_token = None
+        self._connected_cache = None
+    
     def test_connection(self):
         """Probar conexión"""
         if not self.is_connected():
@@ -405,4 +733,17 @@ class ShopifyConnector:
             else:
                 return False, "No se pudo obtener información de la tienda"
         except Exception as e:
-            return False, f"Error en la conexión: {str(e)}"
\ No newline at end of file
+            return False, f"Error en la conexión: {str(e)}"
+
+# Una instancia por sesión de navegador: sobrevive a los reruns (sesión HTTP, RNG,
+# caché de conexión) sin compartir credenciales entre usuarios
+@st.cache_resource(show_spinner=False, max_entries=256)
+def _shopify_connector_for(session_id):
+    return ShopifyConnector()
+
+def get_shopify_connector():
+    """Obtener el conector Shopify de la sesión actual"""
+    from streamlit.runtime.scriptrunner import get_script_run_ctx
+    
+    ctx = get_script_run_ctx()
+    return _shopify_connector_for(ctx.session_id if ctx else None)
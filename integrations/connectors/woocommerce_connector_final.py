@@ -3,6 +3,18 @@ import streamlit as st
 import pandas as pd
 import numpy as np
 from datetime import datetime, timedelta
+import re
+
+# Formato de las claves REST de WooCommerce (prefijo + 40 hex)
+_CK_RE = re.compile(r'^ck_[a-f0-9]{40,}$')
+_CS_RE = re.compile(r'^cs_[a-f0-9]{40,}$')
+
+WOOCOMMERCE_DTYPES = {
+    'orders': np.int32,
+    'revenue': np.float32,
+    'new_customers': np.int32,
+    'products_sold': np.int32
+}
 
 class WooCommerceConnector:
     def __init__(self):
@@ -12,6 +24,8 @@ class WooCommerceConnector:
         self.site_url = None
         self.consumer_key = None
         self.consumer_secret = None
+        self._connected_cache = None
+        self._rng = np.random.default_rng()
     
     def configure(self):
         """Configuración visual del conector WooCommerce"""
@@ -21,6 +35,7 @@ class WooCommerceConnector:
         
         with col1:
             st.write("### Configuración de la Tienda")
+            credentials = (self.site_url, self.consumer_key, self.consumer_secret)
             
             self.site_url = st.text_input(
                 "URL del sitio",
@@ -42,6 +57,9 @@ class WooCommerceConnector:
                 placeholder="cs_xxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxx"
             )
             
+            if (self.site_url, self.consumer_key, self.consumer_secret) != credentials:
+                self._connected_cache = None
+            
             if all([self.site_url, self.consumer_key, self.consumer_secret]):
                 if st.button("🔍 Probar Conexión"):
                     if self._test_api_connection():
@@ -101,26 +119,31 @@ class WooCommerceConnector:
     
     def _test_api_connection(self):
         # Simular test de conexión
-        return all([
-            self.site_url.startswith('http'),
-            len(self.consumer_key) > 20,
-            len(self.consumer_secret) > 20
-        ])
+        return bool(
+            self.site_url.startswith('http') and
+            _CK_RE.match(self.consumer_key) and
+            _CS_RE.match(self.consumer_secret)
+        )
     
     def _get_store_info(self):
         return {
             'name': 'Mi Tienda WooCommerce',
             'version': '8.5.2',
-            'products': np.random.randint(50, 500),
-            'orders': np.random.randint(100, 800)
+            'products': self._rng.integers(50, 500),
+            'orders': self._rng.integers(100, 800)
         }
     
     def is_connected(self):
-        return all([
-            'woocommerce_consumer_key' in st.session_state or self.consumer_key,
-            'woocommerce_consumer_secret' in st.session_state or self.consumer_secret,
-            'woocommerce_site_url' in st.session_state or self.site_url
-        ])
+        # Solo se memoriza el resultado positivo; se invalida al cambiar credenciales
+        if self._connected_cache is None:
+            state = st.session_state
+            connected = bool(
+                ('woocommerce_consumer_key' in state or self.consumer_key) and
+                ('woocommerce_consumer_secret' in state or self.consumer_secret) and
+                ('woocommerce_site_url' in state or self.site_url)
+            )
+            self._connected_cache = connected or None
+        return bool(self._connected_cache)
     
     def fetch_data(self, date_range=30):
         """Obtener datos de WooCommerce"""
@@ -131,13 +154,16 @@ class WooCommerceConnector:
         start_date = end_date - timedelta(days=date_range)
         dates = pd.date_range(start=start_date, end=end_date, freq='D')
         
-        return pd.DataFrame({
+        df = pd.DataFrame({
             'date': dates,
-            'orders': np.random.randint(5, 35, len(dates)),
-            'revenue': np.random.uniform(500, 2500, len(dates)),
-            'new_customers': np.random.randint(2, 15, len(dates)),
-            'products_sold': np.random.randint(15, 85, len(dates))
+            'orders': self._rng.integers(5, 35, len(dates)),
+            'revenue': self._rng.uniform(500, 2500, len(dates)),
+            'new_customers': self._rng.integers(2, 15, len(dates)),
+            'products_sold': self._rng.integers(15, 85, len(dates))
         })
+        
+        # Conteos y montos caben en 32 bits
+        return df.astype(WOOCOMMERCE_DTYPES)
     
     def get_summary_metrics(self):
         """Obtener métricas resumen"""
@@ -150,9 +176,15 @@ class WooCommerceConnector:
             'total_revenue': round(df['revenue'].sum(), 2),
             'avg_order_value': round(df['revenue'].sum() / df['orders'].sum(), 2),
             'total_customers': int(df['new_customers'].sum()),
-            'revenue_change': round(np.random.uniform(-5, 20), 1)
+            'revenue_change': round(self._rng.uniform(-5, 20), 1)
         }
     
+    def disconnect(self):
+        """Olvidar las credenciales"""
+        self.consumer_key = None
+        self.consumer_secret = None
+        self._connected_cache = None
+    
     def test_connection(self):
         if not self.is_connected():
             return False, "Credenciales no configuradas"
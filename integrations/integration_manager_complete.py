@@ -1,26 +1,222 @@
 # integrations/manager.py
 import streamlit as st
-from integrations.connectors.ga4_connector import GA4Connector
-from integrations.connectors.meta_connector import MetaConnector
-from integrations.connectors.shopify_connector import ShopifyConnector
-from integrations.connectors.woocommerce_connector import WooCommerceConnector
-from integrations.connectors.klaviyo_connector import KlaviyoConnector
-from integrations.connectors.mailerlite_connector import MailerLiteConnector
-from integrations.connectors.mailchimp_connector import MailchimpConnector
-from integrations.connectors.csv_connector import CSVConnector
+from collections import Counter
+from functools import cached_property
+import importlib
+import hashlib
+from types import MappingProxyType, SimpleNamespace
+from concurrent.futures import ThreadPoolExecutor, as_completed, TimeoutError as FutureTimeoutError
+
+# Módulo y fábrica de cada conector: se importan solo cuando se usan (los SDKs pesan)
+_CONNECTOR_SPECS = {
+    'ga4': ('integrations.connectors.ga4_connector', 'GA4Connector'),
+    'meta': ('integrations.connectors.meta_connector', 'MetaConnector'),
+    'shopify': ('integrations.connectors.shopify_connector', 'get_shopify_connector'),
+    'woocommerce': ('integrations.connectors.woocommerce_connector', 'WooCommerceConnector'),
+    'klaviyo': ('integrations.connectors.klaviyo_connector', 'KlaviyoConnector'),
+    'mailerlite': ('integrations.connectors.mailerlite_connector', 'MailerLiteConnector'),
+    'mailchimp': ('integrations.connectors.mailchimp_connector', 'MailchimpConnector'),
+    'csv': ('integrations.connectors.csv_connector', 'CSVConnector')
+}
+
+def _create_connector(key):
+    """Importar el módulo del conector y crear la instancia"""
+    module_name, factory_name = _CONNECTOR_SPECS[key]
+    return getattr(importlib.import_module(module_name), factory_name)()
+
+# Los conectores guardan credenciales del usuario: se comparten entre reruns de la
+# misma sesión de navegador, nunca entre sesiones distintas
+@st.cache_resource(show_spinner=False, max_entries=2048)
+def _session_connector(key, session_id):
+    return _create_connector(key)
+
+def _session_id():
+    """Id de la sesión de navegador actual (None fuera de un script run)"""
+    from streamlit.runtime.scriptrunner import get_script_run_ctx
+    
+    ctx = get_script_run_ctx()
+    return ctx.session_id if ctx else None
+
+def _get_connector(key):
+    """Conector de la sesión actual, reutilizado entre reruns"""
+    return _session_connector(key, _session_id())
+
+# Atributos de credenciales de los conectores: si cambian, cambian los datos
+_CREDENTIAL_ATTRS = (
+    'access_token', 'api_key', 'consumer_key', 'consumer_secret',
+    'shop_url', 'site_url', 'server', 'property_id', 'ad_account_id'
+)
+
+def _connector_fingerprint(key, connector):
+    """(última sincronización, hash de credenciales) de un conector, para claves de caché"""
+    # Configuración guardada: dict en connector_<clave> o dataclass (Meta) en <clave>
+    saved = st.session_state.get(f'connector_{key}') or st.session_state.get(key)
+    last_sync = saved.get('last_sync') if isinstance(saved, dict) else getattr(saved, 'last_sync', None)
+    credentials = '\0'.join(str(getattr(connector, attr, None) or '') for attr in _CREDENTIAL_ATTRS)
+    return last_sync, hashlib.blake2b(credentials.encode(), digest_size=8).hexdigest()
+
+@st.cache_data(ttl=300, show_spinner=False)
+def _fetch_connector_data(key, date_range, session_id, fingerprint):
+    """Datos de un conector durante 5 minutos, mientras no cambie su configuración"""
+    return _session_connector(key, session_id).fetch_data(date_range)
+
+@st.cache_data(ttl=30, show_spinner=False)
+def _cached_test(key, session_id, fingerprint):
+    """Resultado de test_connection durante 30 s (o hasta que cambie la configuración)"""
+    return _session_connector(key, session_id).test_connection()
+
+# Tiempo máximo de espera para el conjunto de tests de conexión
+CONNECTION_TEST_TIMEOUT = 10
+
+def _context_executor(max_workers):
+    """ThreadPoolExecutor cuyos hilos heredan el contexto de Streamlit (session_state)"""
+    from streamlit.runtime.scriptrunner import add_script_run_ctx, get_script_run_ctx
+    
+    return ThreadPoolExecutor(
+        max_workers=max_workers,
+        initializer=add_script_run_ctx,
+        initargs=(None, get_script_run_ctx())
+    )
+
+# Fragmentos HTML fijos de la página de integraciones
+_HEADER_HTML = """
+<div style='text-align: center; padding: 2rem 0;'>
+    <h1 style='background: linear-gradient(45deg, #667eea 0%, #764ba2 100%); 
+               -webkit-background-clip: text; -webkit-text-fill-color: transparent;
+               font-size: 2.5rem; margin-bottom: 0.5rem;'>
+        🔗 Integraciones
+    </h1>
+    <p style='color: #666; font-size: 1.1rem;'>
+        Conecta tus herramientas de marketing para obtener insights inteligentes
+    </p>
+</div>
+"""
+
+_CARD_TEMPLATE = """
+<div style='border: 2px solid {status_color}; border-radius: 15px; padding: 1.5rem; 
+            margin: 1rem 0; background: linear-gradient(135deg, #ffffff 0%, #f8f9fa 100%);
+            box-shadow: 0 4px 6px rgba(0,0,0,0.1); transition: transform 0.2s;'>
+    <div style='display: flex; justify-content: space-between; align-items: center; margin-bottom: 1rem;'>
+        <h4 style='margin: 0; color: #333;'>{icon} {name}</h4>
+        <span style='background: {priority_color}; color: white; padding: 0.2rem 0.5rem; 
+                    border-radius: 10px; font-size: 0.8rem; font-weight: bold;'>
+            {priority}
+        </span>
+    </div>
+    <p style='color: #666; margin: 0.5rem 0; font-size: 0.9rem;'>{description}</p>
+    <p style='margin: 0; color: {status_color}; font-weight: bold; font-size: 0.9rem;'>{status_text}</p>
+</div>
+"""
+
+_GRID_TEMPLATE = """
+<div style='display: grid; grid-template-columns: repeat({columns}, 1fr); gap: 1rem;'>
+{cards}
+</div>
+"""
+
+_HEALTH_ROW_TEMPLATE = """
+<div style='border-left: 4px solid {color}; background: #f8f9fa; 
+            padding: 1rem; margin: 0.5rem 0; border-radius: 5px;'>
+    <strong>{icon} {connector_name}</strong> - {status}<br>
+    <small style='color: #666;'>{message}</small>
+</div>
+"""
+
+_SUMMARY_METRIC_TEMPLATE = """<div title='{help}'><div style='color: #666; font-size: 0.9rem;'>{label}</div><div style='font-size: 2rem; font-weight: bold; color: #333;'>{value}</div></div>"""
+
+_SUMMARY_TEMPLATE = """
+<div style='display: grid; grid-template-columns: repeat(4, 1fr); gap: 1rem; margin-bottom: 1rem;'>{metrics}</div>
+<div style='background: #e9ecef; border-radius: 5px; height: 0.5rem; margin-bottom: 1rem;'>
+    <div style='background: #667eea; border-radius: 5px; height: 100%; width: {progress}%;'></div>
+</div>
+<div style='border-left: 4px solid {message_color}; background: #f8f9fa; padding: 1rem; border-radius: 5px;'>{message}</div>
+"""
+
+# Estado de conexión -> (color, texto de estado, texto del botón, tipo de botón)
+_STATUS_STYLE = {
+    True: ('#28a745', '🟢 Conectado', '⚙️ Configurar', 'secondary'),
+    False: ('#6c757d', '⚪ No conectado', '🔗 Conectar', 'primary')
+}
+
+# Prioridad visual
+_PRIORITY_COLORS = {
+    'high': '#dc3545',
+    'medium': '#ffc107',
+    'low': '#28a745'
+}
+
+_CATEGORIES = {
+    'analytics': {'name': '📊 Analytics', 'description': 'Datos de tráfico y comportamiento'},
+    'advertising': {'name': '📢 Publicidad', 'description': 'Campañas y performance publicitaria'},
+    'ecommerce': {'name': '🛍️ E-commerce', 'description': 'Ventas, productos y clientes'},
+    'email': {'name': '📧 Email Marketing', 'description': 'Campañas de email y automatización'},
+    'data': {'name': '📄 Datos Personalizados', 'description': 'Importar datos desde archivos'}
+}
+
+def _summary_html(connected_count, total_connectors):
+    """Métricas, barra de progreso y mensaje del resumen en un solo bloque HTML"""
+    connection_rate = (connected_count / total_connectors) * 100 if total_connectors > 0 else 0
+    pending = total_connectors - connected_count
+    
+    if connected_count == 0:
+        message_color, message = "#ffc107", "💡 <strong>Conecta al menos 2-3 integraciones</strong> para obtener insights completos de tu marketing"
+    elif connected_count < 3:
+        message_color, message = "#17a2b8", "🚀 <strong>¡Buen comienzo!</strong> Conecta más integraciones para obtener una vista 360° de tu performance"
+    else:
+        message_color, message = "#28a745", "🎉 <strong>¡Excelente!</strong> Tienes suficientes integraciones para análisis completos"
+    
+    metrics = ''.join(
+        _SUMMARY_METRIC_TEMPLATE.format_map({'label': label, 'value': value, 'help': help_text})
+        for label, value, help_text in (
+            ("Total Integraciones", total_connectors, "Número total de conectores disponibles"),
+            ("Conectadas", connected_count, "Integraciones activas y funcionando"),
+            ("Tasa de Conexión", f"{connection_rate:.0f}%", "Porcentaje de integraciones conectadas"),
+            ("Pendientes", pending, "Integraciones disponibles para conectar")
+        )
+    )
+    return _SUMMARY_TEMPLATE.format_map({
+        'metrics': metrics,
+        'progress': f"{connection_rate:.0f}",
+        'message_color': message_color,
+        'message': message
+    })
+
+def _close_configuration(message=None):
+    """Callback: cerrar el panel de configuración antes de que empiece el rerun"""
+    st.session_state['active_configure'] = None
+    if message:
+        st.toast(message)
+
+def _health_row_html(result):
+    """Fila HTML con el resultado del test de un conector"""
+    return _HEALTH_ROW_TEMPLATE.format_map({
+        'color': "#28a745" if result['success'] else "#dc3545",
+        'icon': "✅" if result['success'] else "❌",
+        'connector_name': result['connector_name'],
+        'status': "Funcionando" if result['success'] else "Error",
+        'message': result['message']
+    })
+
+@st.cache_data(show_spinner=False)
+def _render_card_html(connector_key, icon, name, description, priority, is_connected):
+    """HTML de la tarjeta de un conector (solo depende de valores primitivos)"""
+    status_color, status_text, _, _ = _STATUS_STYLE[is_connected]
+    priority_color = _PRIORITY_COLORS.get(priority, '#6c757d')
+    
+    return _CARD_TEMPLATE.format_map({
+        'status_color': status_color,
+        'status_text': status_text,
+        'priority_color': priority_color,
+        'priority': priority.upper(),
+        'icon': icon,
+        'name': name,
+        'description': description
+    })
 
 class IntegrationManager:
     def __init__(self):
-        self.connectors = {
-            'ga4': GA4Connector(),
-            'meta': MetaConnector(),
-            'shopify': ShopifyConnector(),
-            'woocommerce': WooCommerceConnector(),
-            'klaviyo': KlaviyoConnector(),
-            'mailerlite': MailerLiteConnector(),
-            'mailchimp': MailchimpConnector(),
-            'csv': CSVConnector()
-        }
+        # Los conectores se crean la primera vez que se usan
+        self._instances = {}
         
         self.connector_info = {
             'ga4': {
@@ -72,21 +268,62 @@ class IntegrationManager:
                 'priority': 'low'
             }
         }
+        
+        # Claves de widgets por conector, construidas una sola vez
+        self._keys = {
+            key: SimpleNamespace(btn=f'btn_{key}', close=f'close_{key}', err=f'error_close_{key}')
+            for key in _CONNECTOR_SPECS
+        }
+        
+        self._snapshot = None
+        self._connected_view = None
+    
+    # Agrupaciones estáticas de connector_info: se calculan una vez por instancia
+    @cached_property
+    def _by_category(self):
+        by_category = {}
+        for connector_key, info in self.connector_info.items():
+            by_category.setdefault(info['category'], []).append(connector_key)
+        return by_category
+    
+    @cached_property
+    def _category_totals(self):
+        return Counter(info['category'] for info in self.connector_info.values())
+    
+    @cached_property
+    def _priority_totals(self):
+        return Counter(info['priority'] for info in self.connector_info.values())
+    
+    def _get(self, key):
+        """Obtener (creándolo si hace falta) el conector indicado"""
+        connector = self._instances.get(key)
+        if connector is None:
+            connector = self._instances[key] = _get_connector(key)
+        return connector
+    
+    @property
+    def connectors(self):
+        """Todos los conectores; instancia los que aún no existan"""
+        return {key: self._get(key) for key in _CONNECTOR_SPECS}
+    
+    def _connection_snapshot(self):
+        """Estado de conexión de cada conector, calculado una sola vez por instancia"""
+        if self._snapshot is None:
+            self._snapshot = {name: self._get(name).is_connected() for name in _CONNECTOR_SPECS}
+        return self._snapshot
+    
+    def invalidate_connection_snapshot(self):
+        """Forzar a recalcular el estado tras cambiar la configuración de un conector"""
+        self._snapshot = None
+        self._connected_view = None
+    
+    def connected_count(self):
+        """Número de conectores activos, sin construir el diccionario de instancias"""
+        return sum(self._connection_snapshot().values())
     
     def show_integrations_page(self):
         """Mostrar página principal de integraciones"""
-        st.markdown("""
-        <div style='text-align: center; padding: 2rem 0;'>
-            <h1 style='background: linear-gradient(45deg, #667eea 0%, #764ba2 100%); 
-                       -webkit-background-clip: text; -webkit-text-fill-color: transparent;
-                       font-size: 2.5rem; margin-bottom: 0.5rem;'>
-                🔗 Integraciones
-            </h1>
-            <p style='color: #666; font-size: 1.1rem;'>
-                Conecta tus herramientas de marketing para obtener insights inteligentes
-            </p>
-        </div>
-        """, unsafe_allow_html=True)
+        st.markdown(_HEADER_HTML, unsafe_allow_html=True)
         
         # Mostrar resumen de conexiones
         self._show_connection_summary()
@@ -98,225 +335,193 @@ class IntegrationManager:
         """Mostrar resumen de conexiones activas"""
         st.markdown("### 📊 Estado de Conexiones")
         
-        total_connectors = len(self.connectors)
-        connected_count = sum(1 for connector in self.connectors.values() if connector.is_connected())
-        
-        col1, col2, col3, col4 = st.columns(4)
-        
-        with col1:
-            st.metric(
-                "Total Integraciones",
-                total_connectors,
-                help="Número total de conectores disponibles"
-            )
-        
-        with col2:
-            st.metric(
-                "Conectadas",
-                connected_count,
-                f"+{connected_count}" if connected_count > 0 else None,
-                help="Integraciones activas y funcionando"
-            )
-        
-        with col3:
-            connection_rate = (connected_count / total_connectors) * 100 if total_connectors > 0 else 0
-            st.metric(
-                "Tasa de Conexión",
-                f"{connection_rate:.0f}%",
-                help="Porcentaje de integraciones conectadas"
-            )
-        
-        with col4:
-            pending = total_connectors - connected_count
-            st.metric(
-                "Pendientes",
-                pending,
-                f"-{pending}" if pending > 0 else None,
-                help="Integraciones disponibles para conectar"
-            )
+        total_connectors = len(_CONNECTOR_SPECS)
+        connected_count = self.connected_count()
         
-        # Barra de progreso visual
-        progress = connected_count / total_connectors if total_connectors > 0 else 0
-        st.progress(progress)
+        # El bloque solo depende de los dos conteos: se reutiliza mientras no cambien
+        signature = (connected_count, total_connectors)
+        if st.session_state.get('_summary_sig') != signature:
+            st.session_state['_summary_html'] = _summary_html(connected_count, total_connectors)
+            st.session_state['_summary_sig'] = signature
         
-        if connected_count == 0:
-            st.warning("💡 **Conecta al menos 2-3 integraciones** para obtener insights completos de tu marketing")
-        elif connected_count < 3:
-            st.info("🚀 **¡Buen comienzo!** Conecta más integraciones para obtener una vista 360° de tu performance")
-        else:
-            st.success("🎉 **¡Excelente!** Tienes suficientes integraciones para análisis completos")
+        st.markdown(st.session_state['_summary_html'], unsafe_allow_html=True)
     
     def _show_integrations_by_category(self):
         """Mostrar integraciones organizadas por categoría"""
-        categories = {
-            'analytics': {'name': '📊 Analytics', 'description': 'Datos de tráfico y comportamiento'},
-            'advertising': {'name': '📢 Publicidad', 'description': 'Campañas y performance publicitaria'},
-            'ecommerce': {'name': '🛍️ E-commerce', 'description': 'Ventas, productos y clientes'},
-            'email': {'name': '📧 Email Marketing', 'description': 'Campañas de email y automatización'},
-            'data': {'name': '📄 Datos Personalizados', 'description': 'Importar datos desde archivos'}
-        }
-        
-        # Agrupar conectores por categoría
-        connectors_by_category = {}
-        for connector_key, info in self.connector_info.items():
-            category = info['category']
-            if category not in connectors_by_category:
-                connectors_by_category[category] = []
-            connectors_by_category[category].append(connector_key)
+        # Un único form: los botones de las tarjetas se envían juntos en un solo rerun
+        with st.form(key='integrations_form', clear_on_submit=False):
+            # Mostrar cada categoría
+            for category_key, category_info in _CATEGORIES.items():
+                if category_key in self._by_category:
+                    st.markdown(f"### {category_info['name']}")
+                    st.write(category_info['description'])
+                    
+                    # Todas las tarjetas de la categoría en un único bloque HTML
+                    category_connectors = self._by_category[category_key]
+                    n_cols = min(3, len(category_connectors))
+                    # Sin líneas en blanco entre tarjetas: cortarían el bloque HTML en Markdown
+                    cards = '\n'.join(self._card_html(connector_key).strip() for connector_key in category_connectors)
+                    st.markdown(
+                        _GRID_TEMPLATE.format_map({'columns': n_cols, 'cards': cards}),
+                        unsafe_allow_html=True
+                    )
+                    
+                    # Solo los botones son widgets, alineados con la rejilla
+                    cols = st.columns(n_cols)
+                    for i, connector_key in enumerate(category_connectors):
+                        with cols[i % n_cols]:
+                            self._show_connector_card(connector_key)
+                    
+                    st.markdown("---")
         
-        # Mostrar cada categoría
-        for category_key, category_info in categories.items():
-            if category_key in connectors_by_category:
-                st.markdown(f"### {category_info['name']}")
-                st.write(category_info['description'])
-                
-                # Mostrar conectores de esta categoría en columnas
-                category_connectors = connectors_by_category[category_key]
-                cols = st.columns(min(3, len(category_connectors)))
-                
-                for i, connector_key in enumerate(category_connectors):
-                    with cols[i % len(cols)]:
-                        self._show_connector_card(connector_key)
-                
-                st.markdown("---")
+        # configure() usa st.button, que no puede ir dentro de un form
+        self._show_active_configuration()
     
-    def _show_connector_card(self, connector_key):
-        """Mostrar tarjeta individual de conector"""
-        connector = self.connectors[connector_key]
+    def _card_html(self, connector_key):
+        """HTML de la tarjeta de un conector"""
         info = self.connector_info[connector_key]
-        is_connected = connector.is_connected()
-        
-        # Determinar colores y estado
-        if is_connected:
-            status_color = "#28a745"
-            status_text = "🟢 Conectado"
-            button_text = "⚙️ Configurar"
-            button_type = "secondary"
-        else:
-            status_color = "#6c757d"
-            status_text = "⚪ No conectado"
-            button_text = "🔗 Conectar"
-            button_type = "primary"
-        
-        # Prioridad visual
-        priority_colors = {
-            'high': '#dc3545',
-            'medium': '#ffc107',
-            'low': '#28a745'
-        }
-        priority_color = priority_colors.get(info['priority'], '#6c757d')
-        
-        # Tarjeta del conector
-        st.markdown(f"""
-        <div style='border: 2px solid {status_color}; border-radius: 15px; padding: 1.5rem; 
-                    margin: 1rem 0; background: linear-gradient(135deg, #ffffff 0%, #f8f9fa 100%);
-                    box-shadow: 0 4px 6px rgba(0,0,0,0.1); transition: transform 0.2s;'>
-            <div style='display: flex; justify-content: space-between; align-items: center; margin-bottom: 1rem;'>
-                <h4 style='margin: 0; color: #333;'>{connector.icon} {info['name']}</h4>
-                <span style='background: {priority_color}; color: white; padding: 0.2rem 0.5rem; 
-                            border-radius: 10px; font-size: 0.8rem; font-weight: bold;'>
-                    {info['priority'].upper()}
-                </span>
-            </div>
-            <p style='color: #666; margin: 0.5rem 0; font-size: 0.9rem;'>{info['description']}</p>
-            <p style='margin: 0; color: {status_color}; font-weight: bold; font-size: 0.9rem;'>{status_text}</p>
-        </div>
-        """, unsafe_allow_html=True)
+        name, description, priority = info['name'], info['description'], info['priority']
+        return _render_card_html(
+            connector_key, self._get(connector_key).icon, name, description,
+            priority, self._connection_snapshot()[connector_key]
+        )
+    
+    def _show_connector_card(self, connector_key):
+        """Mostrar el botón de acción de un conector"""
+        _, _, button_text, button_type = _STATUS_STYLE[self._connection_snapshot()[connector_key]]
         
         # Botón de acción
-        if st.button(
+        if st.form_submit_button(
             button_text, 
-            key=f"btn_{connector_key}",
+            key=self._keys[connector_key].btn,
             type=button_type,
             use_container_width=True
         ):
-            st.session_state[f'configure_{connector_key}'] = True
-            st.rerun()
+            # Solo un conector en configuración a la vez; el panel se dibuja
+            # más abajo en este mismo rerun
+            st.session_state['active_configure'] = connector_key
+    
+    def _show_active_configuration(self):
+        """Mostrar la configuración del conector seleccionado, si hay alguno"""
+        connector_key = st.session_state.get('active_configure')
+        if connector_key is None:
+            return
         
-        # Mostrar configuración si está seleccionada
-        if st.session_state.get(f'configure_{connector_key}', False):
-            with st.expander(f"⚙️ Configurar {info['name']}", expanded=True):
-                try:
-                    connector.configure()
-                    
-                    # Botón para cerrar configuración
-                    if st.button(f"✅ Finalizar configuración de {info['name']}", key=f"close_{connector_key}"):
-                        st.session_state[f'configure_{connector_key}'] = False
-                        st.success(f"Configuración de {info['name']} completada")
-                        st.rerun()
+        connector = self._get(connector_key)
+        info = self.connector_info[connector_key]
+        with st.expander(f"⚙️ Configurar {info['name']}", expanded=True):
+            try:
+                connector.configure()
+                self.invalidate_connection_snapshot()
                 
-                except Exception as e:
-                    st.error(f"Error en la configuración de {info['name']}: {str(e)}")
-                    if st.button(f"❌ Cerrar", key=f"error_close_{connector_key}"):
-                        st.session_state[f'configure_{connector_key}'] = False
-                        st.rerun()
+                # Botón para cerrar configuración
+                st.button(
+                    f"✅ Finalizar configuración de {info['name']}",
+                    key=self._keys[connector_key].close,
+                    on_click=_close_configuration,
+                    args=(f"Configuración de {info['name']} completada",)
+                )
+            
+            except Exception as e:
+                st.error(f"Error en la configuración de {info['name']}: {str(e)}")
+                st.button(f"❌ Cerrar", key=self._keys[connector_key].err, on_click=_close_configuration)
+    
+    def _active_connectors(self, snapshot=None):
+        """Pares (clave, conector) de los conectados según el snapshot dado o el actual"""
+        if snapshot is None:
+            snapshot = self._connection_snapshot()
+        return [(name, self._get(name)) for name, connected in snapshot.items() if connected]
     
     def get_connected_connectors(self):
-        """Obtener lista de conectores activos"""
-        return {
-            name: connector for name, connector in self.connectors.items() 
-            if connector.is_connected()
-        }
+        """Obtener lista de conectores activos (vista de solo lectura)"""
+        if self._connected_view is None:
+            self._connected_view = MappingProxyType(dict(self._active_connectors()))
+        return self._connected_view
     
-    def get_all_data(self, date_range=30):
+    def get_all_data(self, date_range=30, snapshot=None):
         """Obtener datos de todos los conectores activos"""
         all_data = {}
+        active = self._active_connectors(snapshot)
         
-        for name, connector in self.connectors.items():
-            if connector.is_connected():
-                try:
-                    data = connector.fetch_data(date_range)
-                    if data is not None:
-                        all_data[name] = data
-                except Exception as e:
-                    st.warning(f"Error al obtener datos de {name}: {str(e)}")
+        # Las APIs son independientes: se consultan en paralelo (con caché de 5 minutos)
+        session_id = _session_id()
+        with _context_executor(len(active) or 1) as executor:
+            futures = {
+                executor.submit(
+                    _fetch_connector_data, name, date_range, session_id,
+                    _connector_fingerprint(name, connector)
+                ): name
+                for name, connector in active
+            }
+            results = {futures[future]: future for future in as_completed(futures)}
+        
+        for name, _ in active:
+            try:
+                data = results[name].result()
+                if data is not None:
+                    all_data[name] = data
+            except Exception as e:
+                st.warning(f"Error al obtener datos de {name}: {str(e)}")
         
         return all_data
     
-    def test_all_connections(self):
-        """Probar todas las conexiones activas"""
-        results = {}
-        
-        for name, connector in self.connectors.items():
-            if connector.is_connected():
+    def _iter_connection_tests(self, active):
+        """Lanzar los tests en paralelo y devolver (clave, resultado) según van terminando"""
+        session_id = _session_id()
+        executor = _context_executor(len(active) or 1)
+        futures = {
+            executor.submit(_cached_test, name, session_id, _connector_fingerprint(name, connector)): name
+            for name, connector in active
+        }
+        pending = {name for name, _ in active}
+        try:
+            for future in as_completed(futures, timeout=CONNECTION_TEST_TIMEOUT):
+                name = futures[future]
+                pending.discard(name)
                 try:
-                    success, message = connector.test_connection()
-                    results[name] = {
+                    success, message = future.result()
+                    yield name, {
                         'success': success,
                         'message': message,
                         'connector_name': self.connector_info[name]['name']
                     }
                 except Exception as e:
-                    results[name] = {
+                    yield name, {
                         'success': False,
                         'message': f"Error en test: {str(e)}",
                         'connector_name': self.connector_info[name]['name']
                     }
+        except FutureTimeoutError:
+            for name, _ in active:
+                if name in pending:
+                    yield name, {
+                        'success': False,
+                        'message': f"Sin respuesta tras {CONNECTION_TEST_TIMEOUT}s",
+                        'connector_name': self.connector_info[name]['name']
+                    }
+        finally:
+            executor.shutdown(wait=False)
+    
+    def test_all_connections(self, snapshot=None):
+        """Probar todas las conexiones activas"""
+        active = self._active_connectors(snapshot)
+        results = dict(self._iter_connection_tests(active))
         
-        return results
+        # Mantener el orden de los conectores, no el de llegada
+        return {name: results[name] for name, _ in active}
     
     def show_connection_health(self):
         """Mostrar estado de salud de las conexiones"""
         st.markdown("### 🏥 Estado de Salud de Conexiones")
         
-        test_results = self.test_all_connections()
-        
-        if not test_results:
+        active = self._active_connectors()
+        if not active:
             st.info("No hay conexiones activas para probar")
             return
         
-        for connector_key, result in test_results.items():
-            icon = "✅" if result['success'] else "❌"
-            status = "Funcionando" if result['success'] else "Error"
-            color = "#28a745" if result['success'] else "#dc3545"
-            
-            st.markdown(f"""
-            <div style='border-left: 4px solid {color}; background: #f8f9fa; 
-                        padding: 1rem; margin: 0.5rem 0; border-radius: 5px;'>
-                <strong>{icon} {result['connector_name']}</strong> - {status}<br>
-                <small style='color: #666;'>{result['message']}</small>
-            </div>
-            """, unsafe_allow_html=True)
+        # Cada fila aparece en cuanto termina su test
+        for connector_key, result in self._iter_connection_tests(active):
+            st.markdown(_health_row_html(result), unsafe_allow_html=True)
     
     def export_configuration(self):
         """Exportar configuración de integraciones"""
@@ -325,8 +530,8 @@ class IntegrationManager:
             'connected_integrations': []
         }
         
-        for name, connector in self.connectors.items():
-            if connector.is_connected():
+        for name, connected in self._connection_snapshot().items():
+            if connected:
                 config['connected_integrations'].append({
                     'name': name,
                     'display_name': self.connector_info[name]['name'],
@@ -338,31 +543,22 @@ class IntegrationManager:
     
     def get_integration_analytics(self):
         """Obtener analytics de uso de integraciones"""
-        analytics = {
-            'total_integrations': len(self.connectors),
-            'connected_integrations': len(self.get_connected_connectors()),
-            'by_category': {},
-            'by_priority': {}
-        }
+        snapshot = self._connection_snapshot()
+        infos = self.connector_info
         
-        # Analytics por categoría
-        for name, info in self.connector_info.items():
-            category = info['category']
-            priority = info['priority']
-            is_connected = self.connectors[name].is_connected()
-            
-            # Por categoría
-            if category not in analytics['by_category']:
-                analytics['by_category'][category] = {'total': 0, 'connected': 0}
-            analytics['by_category'][category]['total'] += 1
-            if is_connected:
-                analytics['by_category'][category]['connected'] += 1
-            
-            # Por prioridad
-            if priority not in analytics['by_priority']:
-                analytics['by_priority'][priority] = {'total': 0, 'connected': 0}
-            analytics['by_priority'][priority]['total'] += 1
-            if is_connected:
-                analytics['by_priority'][priority]['connected'] += 1
+        # Los totales están precalculados; solo se cuentan las conexiones
+        category_connected = Counter(info['category'] for key, info in infos.items() if snapshot[key])
+        priority_connected = Counter(info['priority'] for key, info in infos.items() if snapshot[key])
         
-        return analytics
\ No newline at end of file
+        return {
+            'total_integrations': len(_CONNECTOR_SPECS),
+            'connected_integrations': self.connected_count(),
+            'by_category': {
+                category: {'total': total, 'connected': category_connected[category]}
+                for category, total in self._category_totals.items()
+            },
+            'by_priority': {
+                priority: {'total': total, 'connected': priority_connected[priority]}
+                for priority, total in self._priority_totals.items()
+            }
+        }
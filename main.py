@@ -1,8 +1,13 @@
 import streamlit as st
+import os
+import atexit
+import shutil
+import hashlib
+import tempfile
+import random
 import pandas as pd
-import numpy as np
-import matplotlib.pyplot as plt
-import seaborn as sns
+from concurrent.futures import ThreadPoolExecutor
+from types import MappingProxyType
 
 # Configuración de la página
 st.set_page_config(
@@ -20,6 +25,96 @@ if 'current_step' not in st.session_state:
 if 'user_config' not in st.session_state:
     st.session_state.user_config = {}
 
+# Opciones fijas del onboarding, definidas una sola vez por proceso
+_INDUSTRIES = ("Retail", "E-commerce", "Servicios", "Manufactura", "Tecnología", "Otro")
+_CURRENCIES = ("USD", "EUR", "CLP", "MXN", "ARS", "COL")
+_TIMEZONES = ("America/Santiago", "America/Mexico_City", "America/New_York", "Europe/Madrid")
+_PERIODS = ("Últimos 7 días", "Últimos 30 días", "Últimos 3 meses", "Último año")
+_REFRESH_FREQUENCIES = ("Manual", "Cada hora", "Cada día", "Cada semana")
+_NUMBER_FORMATS = ("1,234.56", "1.234,56", "1 234.56")
+
+# (clave, título, descripción, icono) de cada fuente de datos
+_DATA_OPTIONS = (
+    ("demo", "Usar datos de demostración", "Perfecto para probar el dashboard", "🎮"),
+    ("csv", "Subir archivo CSV/Excel", "Sube tus archivos de ventas", "📁"),
+    ("database", "Conectar base de datos", "MySQL, PostgreSQL, SQL Server", "🗄️"),
+    ("api", "Conectar API", "Shopify, WooCommerce, REST API", "🔌"),
+)
+
+_DATA_OPTION_KEYS = tuple(key for key, _, _, _ in _DATA_OPTIONS)
+_DATA_OPTION_LABELS = MappingProxyType({key: f"{icon} {title}" for key, title, _, icon in _DATA_OPTIONS})
+_DATA_OPTION_CAPTIONS = tuple(description for _, _, description, _ in _DATA_OPTIONS)
+
+_DATA_SOURCE_NAMES = MappingProxyType({
+    'demo': 'Datos de demostración',
+    'csv': 'Archivo CSV/Excel',
+    'database': 'Base de datos',
+    'api': 'API externa'
+})
+
+_API_CATEGORIES = MappingProxyType({
+    "Publicidad": ("Meta Ads (Facebook/Instagram)", "Google Ads", "TikTok Ads", "LinkedIn Ads"),
+    "E-commerce": ("Shopify", "WooCommerce", "Magento", "BigCommerce"),
+    "Analytics": ("Google Analytics", "Mixpanel", "Hotjar", "Adobe Analytics"),
+    "CRM": ("Salesforce", "HubSpot", "Pipedrive", "Zoho CRM"),
+    "Email Marketing": ("Mailchimp", "SendGrid", "ConvertKit", "Klaviyo")
+})
+
+# Claves de user_config con las métricas elegidas en el paso 3
+_METRIC_KEYS = ('metrics_sales', 'metrics_products', 'metrics_customers', 'metrics_geo')
+
+_COLOR_SCHEMES = MappingProxyType({
+    "Azul profesional": ('#1f77b4', '#aec7e8', '#ff7f0e', '#ffbb78'),
+    "Verde natura": ('#2ca02c', '#98df8a', '#d62728', '#ff9896'),
+    "Naranja vibrante": ('#ff7f0e', '#ffbb78', '#2ca02c', '#98df8a'),
+    "Morado creativo": ('#9467bd', '#c5b0d5', '#8c564b', '#c49c94')
+})
+
+# Clave de user_config -> key del widget que la alimenta, por paso
+_WELCOME_FIELDS = MappingProxyType({
+    'company_name': 'welcome_company_name',
+    'industry': 'welcome_industry',
+    'currency': 'welcome_currency',
+    'timezone': 'welcome_timezone'
+})
+_DATA_SOURCE_FIELDS = MappingProxyType({'data_source': 'data_source_choice'})
+_METRICS_FIELDS = MappingProxyType({
+    'metrics_sales': 'sales_metrics',
+    'metrics_products': 'product_metrics',
+    'metrics_customers': 'customer_metrics',
+    'metrics_geo': 'geo_metrics'
+})
+_VISUALIZATION_FIELDS = MappingProxyType({
+    'theme': 'viz_theme',
+    'default_period': 'viz_default_period',
+    'refresh_frequency': 'viz_refresh_frequency',
+    'number_format': 'viz_number_format',
+    'color_scheme': 'viz_color_scheme'
+})
+
+# Los callbacks corren antes del rerun que provoca el clic, así que no hace falta st.rerun()
+def _go_to_step(step):
+    """Callback de navegación entre pasos"""
+    st.session_state.current_step = step
+
+def _submit_step(step, fields):
+    """Callback de Continuar: guardar los valores del paso si cambiaron y avanzar"""
+    config = st.session_state.user_config
+    values = {config_key: st.session_state[widget_key] for config_key, widget_key in fields.items()}
+    if any(config.get(key) != value for key, value in values.items()):
+        config.update(values)
+    st.session_state.current_step = step
+
+def _submit_welcome():
+    """Callback del paso 1: exige el nombre de la empresa antes de avanzar"""
+    if st.session_state.welcome_company_name:
+        _submit_step(2, _WELCOME_FIELDS)
+
+def _complete_onboarding():
+    """Callback de Completar configuración"""
+    st.session_state.onboarding_complete = True
+    st.balloons()
+
 def show_onboarding():
     """Proceso de onboarding paso a paso"""
     
@@ -31,98 +126,63 @@ def show_onboarding():
     st.progress(progress)
     st.write(f"Paso {st.session_state.current_step} de 5")
     
-    if st.session_state.current_step == 1:
-        show_step_welcome()
-    elif st.session_state.current_step == 2:
-        show_step_data_source()
-    elif st.session_state.current_step == 3:
-        show_step_metrics()
-    elif st.session_state.current_step == 4:
-        show_step_visualization()
-    elif st.session_state.current_step == 5:
-        show_step_final()
+    _STEPS[st.session_state.current_step - 1]()
 
 def show_step_welcome():
     """Paso 1: Bienvenida y configuración básica"""
     st.subheader("Paso 1: Información Básica")
     
-    col1, col2 = st.columns(2)
-    
-    with col1:
-        company_name = st.text_input(
-            "Nombre de tu empresa:",
-            placeholder="Ej: Mi Empresa S.A."
-        )
+    # El formulario evita un rerun por cada tecla en el nombre de la empresa
+    with st.form("step_1_form"):
+        col1, col2 = st.columns(2)
         
-        industry = st.selectbox(
-            "Industria:",
-            ["Retail", "E-commerce", "Servicios", "Manufactura", "Tecnología", "Otro"]
-        )
-    
-    with col2:
-        currency = st.selectbox(
-            "Moneda:",
-            ["USD", "EUR", "CLP", "MXN", "ARS", "COL"]
-        )
+        with col1:
+            company_name = st.text_input(
+                "Nombre de tu empresa:",
+                placeholder="Ej: Mi Empresa S.A.",
+                key="welcome_company_name"
+            )
+            
+            st.selectbox(
+                "Industria:",
+                _INDUSTRIES,
+                key="welcome_industry"
+            )
         
-        timezone = st.selectbox(
-            "Zona horaria:",
-            ["America/Santiago", "America/Mexico_City", "America/New_York", "Europe/Madrid"]
-        )
-    
-    st.markdown("---")
+        with col2:
+            st.selectbox(
+                "Moneda:",
+                _CURRENCIES,
+                key="welcome_currency"
+            )
+            
+            st.selectbox(
+                "Zona horaria:",
+                _TIMEZONES,
+                key="welcome_timezone"
+            )
+        
+        st.markdown("---")
+        
+        submitted = st.form_submit_button("Continuar", type="primary", on_click=_submit_welcome)
     
-    if st.button("Continuar", type="primary", disabled=not company_name):
-        st.session_state.user_config.update({
-            'company_name': company_name,
-            'industry': industry,
-            'currency': currency,
-            'timezone': timezone
-        })
-        st.session_state.current_step = 2
-        st.rerun()
+    if submitted and not company_name:
+        st.warning("Ingresa el nombre de tu empresa para continuar")
 
 def show_step_data_source():
     """Paso 2: Selección de fuente de datos"""
     st.subheader("Paso 2: ¿Cómo quieres conectar tus datos?")
     
-    data_options = {
-        "demo": {
-            "title": "Usar datos de demostración",
-            "description": "Perfecto para probar el dashboard",
-            "icon": "🎮"
-        },
-        "csv": {
-            "title": "Subir archivo CSV/Excel",
-            "description": "Sube tus archivos de ventas",
-            "icon": "📁"
-        },
-        "database": {
-            "title": "Conectar base de datos",
-            "description": "MySQL, PostgreSQL, SQL Server",
-            "icon": "🗄️"
-        },
-        "api": {
-            "title": "Conectar API",
-            "description": "Shopify, WooCommerce, REST API",
-            "icon": "🔌"
-        }
-    }
-    
-    selected_source = None
-    
-    for key, option in data_options.items():
-        col1, col2 = st.columns([1, 4])
-        
-        with col1:
-            if st.button(option["icon"], key=f"btn_{key}"):
-                selected_source = key
-        
-        with col2:
-            st.write(f"**{option['title']}**")
-            st.write(option["description"])
-        
-        st.markdown("---")
+    # Un único radio; la selección persiste entre reruns vía su key
+    selected_source = st.radio(
+        "Fuente:",
+        options=_DATA_OPTION_KEYS,
+        format_func=_DATA_OPTION_LABELS.__getitem__,
+        captions=_DATA_OPTION_CAPTIONS,
+        key="data_source_choice"
+    )
+    
+    st.markdown("---")
     
     # Configuración específica según la selección
     if selected_source == "csv":
@@ -134,15 +194,127 @@ def show_step_data_source():
     
     col1, col2 = st.columns(2)
     with col1:
-        if st.button("Atrás"):
-            st.session_state.current_step = 1
-            st.rerun()
+        st.button("Atrás", on_click=_go_to_step, args=(1,))
     
     with col2:
-        if st.button("Continuar", type="primary"):
-            st.session_state.user_config['data_source'] = selected_source or 'demo'
-            st.session_state.current_step = 3
-            st.rerun()
+        st.button("Continuar", type="primary", on_click=_submit_step, args=(3, _DATA_SOURCE_FIELDS))
+
+# Filas leídas para la vista previa y el mapeo de columnas
+PREVIEW_ROWS = 100
+
+@st.cache_resource
+def _spill_dir():
+    """Directorio temporal de archivos subidos, creado una vez por proceso"""
+    path = tempfile.mkdtemp(prefix='dashboard_uploads_')
+    atexit.register(shutil.rmtree, path, True)
+    return path
+
+def _spill_path(stem, suffix):
+    """Ruta en disco para un archivo subido o su versión tipada"""
+    return os.path.join(_spill_dir(), stem + suffix)
+
+# Tope de disco de los archivos subidos; al superarlo se borran los más antiguos
+SPILL_DIR_MAX_BYTES = 2 << 30
+_PARTIAL_PREFIX = '.partial-'
+
+def _prune_spill_dir(keep):
+    """Borrar los archivos más antiguos mientras el directorio supere el tope"""
+    entries = []
+    with os.scandir(_spill_dir()) as it:
+        for entry in it:
+            # Las copias en curso de otras sesiones no se tocan
+            if entry.name.startswith(_PARTIAL_PREFIX) or entry.path == keep:
+                continue
+            try:
+                stat = entry.stat()
+            except FileNotFoundError:
+                continue
+            entries.append((stat.st_mtime, stat.st_size, entry.path))
+    
+    total = sum(size for _, size, _ in entries) + os.path.getsize(keep)
+    for _, size, path in sorted(entries):
+        if total <= SPILL_DIR_MAX_BYTES:
+            break
+        try:
+            os.remove(path)
+        except FileNotFoundError:
+            pass
+        total -= size
+
+@st.cache_resource(max_entries=64)
+def _store_upload(file_id, name, _uploaded_file):
+    """Copiar el archivo subido a disco por bloques; devuelve (hash, ruta)"""
+    digest = hashlib.blake2b(digest_size=16)
+    fd, tmp_path = tempfile.mkstemp(prefix=_PARTIAL_PREFIX, dir=_spill_dir())
+    try:
+        _uploaded_file.seek(0)
+        with os.fdopen(fd, 'wb') as dst:
+            for chunk in iter(lambda: _uploaded_file.read(1 << 20), b''):
+                digest.update(chunk)
+                dst.write(chunk)
+        # Streamlit reutiliza el mismo buffer en los siguientes reruns
+        _uploaded_file.seek(0)
+        
+        upload_hash = digest.hexdigest()
+        upload_path = _spill_path(upload_hash, os.path.splitext(name)[1].lower())
+        os.replace(tmp_path, upload_path)
+    except BaseException:
+        # No dejar la copia parcial en disco
+        try:
+            os.remove(tmp_path)
+        except FileNotFoundError:
+            pass
+        raise
+    
+    _prune_spill_dir(keep=upload_path)
+    return upload_hash, upload_path
+
+@st.cache_data(show_spinner=False)
+def _parse_upload(upload_path, nrows=None):
+    """Leer el archivo subido; la ruta incluye el hash del contenido"""
+    if upload_path.endswith('.csv'):
+        return pd.read_csv(upload_path, nrows=nrows)
+    return pd.read_excel(upload_path, nrows=nrows)
+
+def _read_typed(upload_path, date_column, sales_column):
+    """Leer el archivo con tipos explícitos, solo las columnas mapeadas"""
+    usecols = [date_column, sales_column]
+    if upload_path.endswith('.csv'):
+        try:
+            # Tokenizador multihilo de Arrow; el motor C queda como respaldo
+            return pd.read_csv(
+                upload_path,
+                usecols=usecols,
+                dtype={sales_column: 'float32'},
+                parse_dates=[date_column],
+                engine='pyarrow'
+            )
+        except Exception:
+            return pd.read_csv(
+                upload_path,
+                usecols=usecols,
+                dtype={sales_column: 'float32'},
+                parse_dates=[date_column],
+                engine='c',
+                low_memory=False,
+                cache_dates=True
+            )
+    return pd.read_excel(
+        upload_path,
+        usecols=usecols,
+        dtype={sales_column: 'float32'},
+        parse_dates=[date_column]
+    )
+
+@st.cache_data(show_spinner=False)
+def _monthly_sales(upload_path, date_column, sales_column):
+    """Ventas mensuales del archivo subido, con el formato de los datos de ejemplo"""
+    df = _read_typed(upload_path, date_column, sales_column)
+    monthly = df.groupby(df[date_column].dt.to_period('M'))[sales_column].sum()
+    return pd.DataFrame({
+        'mes': pd.Categorical(monthly.index.strftime('%Y-%m')),
+        'ventas': monthly.to_numpy()
+    })
 
 def show_csv_config():
     """Configuración para archivos CSV"""
@@ -156,14 +328,20 @@ def show_csv_config():
     
     if uploaded_file:
         try:
-            if uploaded_file.name.endswith('.csv'):
-                df = pd.read_csv(uploaded_file)
-            else:
-                df = pd.read_excel(uploaded_file)
+            upload_hash, upload_path = _store_upload(
+                uploaded_file.file_id, uploaded_file.name, uploaded_file
+            )
+            if not os.path.exists(upload_path):
+                # El archivo se podó por el tope de disco: copiarlo de nuevo
+                _store_upload.clear()
+                upload_hash, upload_path = _store_upload(
+                    uploaded_file.file_id, uploaded_file.name, uploaded_file
+                )
+            df = _parse_upload(upload_path, nrows=PREVIEW_ROWS)
             
             st.success("Archivo cargado correctamente!")
             st.write("Vista previa:")
-            st.dataframe(df.head())
+            st.dataframe(df.iloc[:5])
             
             # Mapeo de columnas
             st.write("Mapea las columnas de tu archivo:")
@@ -174,8 +352,11 @@ def show_csv_config():
             with col2:
                 sales_column = st.selectbox("Columna de ventas:", df.columns)
             
+            # Solo referencias en la sesión; el archivo completo se lee al cargar el dashboard
             st.session_state.user_config.update({
-                'uploaded_data': df,
+                'upload_name': uploaded_file.name,
+                'upload_hash': upload_hash,
+                'upload_path': upload_path,
                 'date_column': date_column,
                 'sales_column': sales_column
             })
@@ -187,64 +368,84 @@ def show_database_config():
     """Configuración para base de datos"""
     st.info("🗄️ Conecta tu base de datos")
     
-    db_type = st.selectbox("Tipo de base de datos:", ["MySQL", "PostgreSQL", "SQL Server"])
-    
-    col1, col2 = st.columns(2)
-    with col1:
-        host = st.text_input("Host:", placeholder="localhost")
-        database = st.text_input("Base de datos:", placeholder="ventas_db")
-    
-    with col2:
-        port = st.text_input("Puerto:", placeholder="3306")
-        username = st.text_input("Usuario:", placeholder="admin")
-    
-    password = st.text_input("Contraseña:", type="password")
+    with st.form("database_form"):
+        db_type = st.selectbox("Tipo de base de datos:", ["MySQL", "PostgreSQL", "SQL Server"])
+        
+        col1, col2 = st.columns(2)
+        with col1:
+            host = st.text_input("Host:", placeholder="localhost")
+            database = st.text_input("Base de datos:", placeholder="ventas_db")
+        
+        with col2:
+            port = st.text_input("Puerto:", placeholder="3306")
+            username = st.text_input("Usuario:", placeholder="admin")
+        
+        password = st.text_input("Contraseña:", type="password")
+        
+        submitted = st.form_submit_button("Probar conexión")
     
-    if st.button("Probar conexión"):
+    if submitted:
         st.info("Funcionalidad disponible en la versión completa")
 
 def show_api_config():
     """Configuración para APIs"""
     st.info("🔌 Conecta tus plataformas de marketing y ventas")
     
-    api_categories = {
-        "Publicidad": ["Meta Ads (Facebook/Instagram)", "Google Ads", "TikTok Ads", "LinkedIn Ads"],
-        "E-commerce": ["Shopify", "WooCommerce", "Magento", "BigCommerce"],
-        "Analytics": ["Google Analytics", "Mixpanel", "Hotjar", "Adobe Analytics"],
-        "CRM": ["Salesforce", "HubSpot", "Pipedrive", "Zoho CRM"],
-        "Email Marketing": ["Mailchimp", "SendGrid", "ConvertKit", "Klaviyo"]
-    }
-    
     selected_apis = []
     
-    for category, apis in api_categories.items():
+    # Primera pasada: solo leer las casillas
+    for category, apis in _API_CATEGORIES.items():
         with st.expander(f"📊 {category}"):
             for api in apis:
                 if st.checkbox(api, key=f"api_{api}"):
                     selected_apis.append(api)
-                    show_api_credentials(api)
     
     if selected_apis:
         st.session_state.user_config['selected_apis'] = selected_apis
         st.success(f"Seleccionadas {len(selected_apis)} integraciones")
+        
+        if len(selected_apis) > 1 and st.button("🔍 Probar todas las conexiones"):
+            test_all_api_connections(selected_apis)
+        
+        # Segunda pasada: credenciales solo de las APIs seleccionadas, una pestaña por API
+        for tab, api in zip(st.tabs(selected_apis), selected_apis):
+            with tab:
+                show_api_credentials(api)
+
+# Campos de credenciales con widget propio; su key es "<api>_<campo>"
+_API_FIELDS = (
+    'account', 'app_id', 'client_id', 'client_secret', 'credentials', 'customer_id', 'domain',
+    'password', 'property', 'refresh_token', 'secret', 'token', 'url', 'username', 'view'
+)
+
+# Keys de los widgets de cada API de _API_CATEGORIES, formateadas al cargar el módulo
+_API_WIDGET_KEYS = MappingProxyType({
+    api_name: MappingProxyType({
+        **{field: f"{api_name}_{field}" for field in _API_FIELDS},
+        'test': f"test_{api_name}"
+    })
+    for apis in _API_CATEGORIES.values()
+    for api_name in apis
+})
 
 def show_api_credentials(api_name):
     """Mostrar campos específicos para cada API"""
+    keys = _API_WIDGET_KEYS[api_name]
     st.write(f"**Configuración de {api_name}:**")
     
     if api_name == "Meta Ads (Facebook/Instagram)":
         col1, col2 = st.columns(2)
         with col1:
-            app_id = st.text_input("App ID:", key=f"{api_name}_app_id", 
+            app_id = st.text_input("App ID:", key=keys['app_id'], 
                                  help="ID de tu aplicación de Facebook")
             access_token = st.text_input("Access Token:", type="password", 
-                                       key=f"{api_name}_token",
+                                       key=keys['token'],
                                        help="Token de acceso de larga duración")
         with col2:
             app_secret = st.text_input("App Secret:", type="password", 
-                                     key=f"{api_name}_secret")
+                                     key=keys['secret'])
             ad_account_id = st.text_input("Ad Account ID:", 
-                                        key=f"{api_name}_account",
+                                        key=keys['account'],
                                         help="ID de tu cuenta publicitaria (act_XXXXXXX)")
         
         st.info("📖 [Guía: Cómo obtener credenciales de Meta Ads](https://developers.facebook.com/docs/marketing-api/get-started)")
@@ -252,13 +453,13 @@ def show_api_credentials(api_name):
     elif api_name == "Google Ads":
         col1, col2 = st.columns(2)
         with col1:
-            client_id = st.text_input("Client ID:", key=f"{api_name}_client_id")
+            client_id = st.text_input("Client ID:", key=keys['client_id'])
             client_secret = st.text_input("Client Secret:", type="password", 
-                                        key=f"{api_name}_client_secret")
+                                        key=keys['client_secret'])
         with col2:
             refresh_token = st.text_input("Refresh Token:", type="password", 
-                                        key=f"{api_name}_refresh_token")
-            customer_id = st.text_input("Customer ID:", key=f"{api_name}_customer_id",
+                                        key=keys['refresh_token'])
+            customer_id = st.text_input("Customer ID:", key=keys['customer_id'],
                                       help="ID de cliente sin guiones (ej: 1234567890)")
         
         st.info("📖 [Guía: Configurar API de Google Ads](https://developers.google.com/google-ads/api/docs/first-call/overview)")
@@ -268,10 +469,10 @@ def show_api_credentials(api_name):
         with col1:
             shop_domain = st.text_input("Dominio de la tienda:", 
                                       placeholder="mi-tienda.myshopify.com",
-                                      key=f"{api_name}_domain")
+                                      key=keys['domain'])
         with col2:
             api_key = st.text_input("Admin API Access Token:", type="password",
-                                  key=f"{api_name}_token",
+                                  key=keys['token'],
                                   help="Token de la API Admin")
         
         st.info("📖 [Guía: Generar token de Shopify](https://shopify.dev/apps/auth/admin-app-access-tokens)")
@@ -279,21 +480,21 @@ def show_api_credentials(api_name):
     elif api_name == "Google Analytics":
         col1, col2 = st.columns(2)
         with col1:
-            property_id = st.text_input("Property ID:", key=f"{api_name}_property",
+            property_id = st.text_input("Property ID:", key=keys['property'],
                                       help="ID de propiedad de GA4")
             credentials_file = st.file_uploader("Service Account JSON:", 
                                               type=['json'],
-                                              key=f"{api_name}_credentials",
+                                              key=keys['credentials'],
                                               help="Archivo de credenciales de la cuenta de servicio")
         with col2:
-            view_id = st.text_input("View ID (opcional):", key=f"{api_name}_view",
+            view_id = st.text_input("View ID (opcional):", key=keys['view'],
                                   help="Para GA Universal Analytics")
         
         st.info("📖 [Guía: Configurar Google Analytics API](https://developers.google.com/analytics/devguides/reporting/core/v4/quickstart/service-py)")
     
     elif api_name == "HubSpot":
         access_token = st.text_input("Private App Access Token:", type="password",
-                                   key=f"{api_name}_token",
+                                   key=keys['token'],
                                    help="Token de aplicación privada de HubSpot")
         
         st.info("📖 [Guía: Crear aplicación privada en HubSpot](https://developers.hubspot.com/docs/api/private-apps)")
@@ -301,47 +502,59 @@ def show_api_credentials(api_name):
     elif api_name == "Salesforce":
         col1, col2 = st.columns(2)
         with col1:
-            username = st.text_input("Username:", key=f"{api_name}_username")
-            password = st.text_input("Password:", type="password", key=f"{api_name}_password")
+            username = st.text_input("Username:", key=keys['username'])
+            password = st.text_input("Password:", type="password", key=keys['password'])
         with col2:
             security_token = st.text_input("Security Token:", type="password", 
-                                         key=f"{api_name}_token")
+                                         key=keys['token'])
             domain = st.text_input("Domain:", placeholder="your-domain.salesforce.com",
-                                 key=f"{api_name}_domain")
+                                 key=keys['domain'])
     
     else:
         # Configuración genérica para otras APIs
         col1, col2 = st.columns(2)
         with col1:
-            api_url = st.text_input("API URL:", key=f"{api_name}_url",
+            api_url = st.text_input("API URL:", key=keys['url'],
                                   placeholder="https://api.example.com")
         with col2:
             api_token = st.text_input("API Token/Key:", type="password",
-                                    key=f"{api_name}_token")
+                                    key=keys['token'])
     
     # Botón de prueba de conexión
-    if st.button(f"🔍 Probar conexión con {api_name}", key=f"test_{api_name}"):
+    if st.button(f"🔍 Probar conexión con {api_name}", key=keys['test']):
         test_api_connection(api_name)
 
+def _check_api_connection(api_name):
+    """Simular la llamada de prueba a una API; no usa Streamlit, apta para hilos"""
+    # En una implementación real, aquí harías las llamadas a las APIs
+    return random.random() < 0.8  # 80% éxito
+
+def _show_api_test_result(api_name, success):
+    """Mostrar el resultado de la prueba de conexión"""
+    if success:
+        st.success(f"✅ Conexión exitosa con {api_name}")
+        if api_name == "Meta Ads (Facebook/Instagram)":
+            st.info("Se encontraron 3 cuentas publicitarias activas")
+        elif api_name == "Google Ads":
+            st.info("Se encontraron 2 cuentas de Google Ads")
+        elif api_name == "Shopify":
+            st.info("Tienda conectada: 1,234 productos encontrados")
+    else:
+        st.error(f"❌ Error al conectar con {api_name}. Verifica tus credenciales.")
+
 def test_api_connection(api_name):
     """Simular prueba de conexión con las APIs"""
     with st.spinner(f"Probando conexión con {api_name}..."):
-        import time
-        time.sleep(2)  # Simular tiempo de conexión
-        
-        # En una implementación real, aquí harías las llamadas a las APIs
-        success_rate = np.random.choice([True, False], p=[0.8, 0.2])  # 80% éxito
-        
-        if success_rate:
-            st.success(f"✅ Conexión exitosa con {api_name}")
-            if api_name == "Meta Ads (Facebook/Instagram)":
-                st.info("Se encontraron 3 cuentas publicitarias activas")
-            elif api_name == "Google Ads":
-                st.info("Se encontraron 2 cuentas de Google Ads")
-            elif api_name == "Shopify":
-                st.info("Tienda conectada: 1,234 productos encontrados")
-        else:
-            st.error(f"❌ Error al conectar con {api_name}. Verifica tus credenciales.")
+        success = _check_api_connection(api_name)
+    _show_api_test_result(api_name, success)
+
+def test_all_api_connections(api_names):
+    """Probar varias APIs en paralelo; el tiempo total es el de la más lenta"""
+    with st.spinner(f"Probando {len(api_names)} conexiones..."):
+        with ThreadPoolExecutor(max_workers=min(8, len(api_names))) as executor:
+            results = dict(zip(api_names, executor.map(_check_api_connection, api_names)))
+    for api_name, success in results.items():
+        _show_api_test_result(api_name, success)
 
 def show_step_metrics():
     """Paso 3: Selección de métricas"""
@@ -349,115 +562,103 @@ def show_step_metrics():
     
     st.write("Selecciona las métricas más importantes para tu negocio:")
     
-    col1, col2 = st.columns(2)
-    
-    with col1:
-        st.write("**Métricas de Ventas:**")
-        metrics_sales = st.multiselect(
-            "",
-            ["Ventas Totales", "Ventas por Período", "Crecimiento de Ventas", "Promedio de Venta"],
-            default=["Ventas Totales", "Crecimiento de Ventas"],
-            key="sales_metrics"
-        )
+    with st.form("step_3_form"):
+        col1, col2 = st.columns(2)
         
-        st.write("**Métricas de Productos:**")
-        metrics_products = st.multiselect(
-            "",
-            ["Productos Más Vendidos", "Inventario", "Margen por Producto", "Rotación"],
-            default=["Productos Más Vendidos"],
-            key="product_metrics"
-        )
-    
-    with col2:
-        st.write("**Métricas de Clientes:**")
-        metrics_customers = st.multiselect(
-            "",
-            ["Clientes Activos", "Nuevos Clientes", "Valor de Vida del Cliente", "Retención"],
-            default=["Clientes Activos", "Nuevos Clientes"],
-            key="customer_metrics"
-        )
+        with col1:
+            st.write("**Métricas de Ventas:**")
+            st.multiselect(
+                "",
+                ["Ventas Totales", "Ventas por Período", "Crecimiento de Ventas", "Promedio de Venta"],
+                default=["Ventas Totales", "Crecimiento de Ventas"],
+                key="sales_metrics"
+            )
+            
+            st.write("**Métricas de Productos:**")
+            st.multiselect(
+                "",
+                ["Productos Más Vendidos", "Inventario", "Margen por Producto", "Rotación"],
+                default=["Productos Más Vendidos"],
+                key="product_metrics"
+            )
         
-        st.write("**Métricas Geográficas:**")
-        metrics_geo = st.multiselect(
-            "",
-            ["Ventas por Región", "Ventas por Ciudad", "Mapa de Calor", "Distribución"],
-            default=["Ventas por Región"],
-            key="geo_metrics"
-        )
-    
-    col1, col2 = st.columns(2)
-    with col1:
-        if st.button("Atrás"):
-            st.session_state.current_step = 2
-            st.rerun()
-    
-    with col2:
-        if st.button("Continuar", type="primary"):
-            st.session_state.user_config.update({
-                'metrics_sales': metrics_sales,
-                'metrics_products': metrics_products,
-                'metrics_customers': metrics_customers,
-                'metrics_geo': metrics_geo
-            })
-            st.session_state.current_step = 4
-            st.rerun()
+        with col2:
+            st.write("**Métricas de Clientes:**")
+            st.multiselect(
+                "",
+                ["Clientes Activos", "Nuevos Clientes", "Valor de Vida del Cliente", "Retención"],
+                default=["Clientes Activos", "Nuevos Clientes"],
+                key="customer_metrics"
+            )
+            
+            st.write("**Métricas Geográficas:**")
+            st.multiselect(
+                "",
+                ["Ventas por Región", "Ventas por Ciudad", "Mapa de Calor", "Distribución"],
+                default=["Ventas por Región"],
+                key="geo_metrics"
+            )
+        
+        col1, col2 = st.columns(2)
+        with col1:
+            st.form_submit_button("Atrás", on_click=_go_to_step, args=(2,))
+        with col2:
+            st.form_submit_button(
+                "Continuar", type="primary", on_click=_submit_step, args=(4, _METRICS_FIELDS)
+            )
 
 def show_step_visualization():
     """Paso 4: Preferencias de visualización"""
     st.subheader("Paso 4: Personaliza tu dashboard")
     
-    col1, col2 = st.columns(2)
-    
-    with col1:
-        st.write("**Tema del dashboard:**")
-        theme = st.radio(
-            "",
-            ["Claro", "Oscuro", "Automático"],
-            horizontal=True
-        )
+    with st.form("step_4_form"):
+        col1, col2 = st.columns(2)
         
-        st.write("**Período por defecto:**")
-        default_period = st.selectbox(
-            "",
-            ["Últimos 7 días", "Últimos 30 días", "Últimos 3 meses", "Último año"]
-        )
-    
-    with col2:
-        st.write("**Actualización de datos:**")
-        refresh_frequency = st.selectbox(
-            "",
-            ["Manual", "Cada hora", "Cada día", "Cada semana"]
-        )
+        with col1:
+            st.write("**Tema del dashboard:**")
+            st.radio(
+                "",
+                ["Claro", "Oscuro", "Automático"],
+                horizontal=True,
+                key="viz_theme"
+            )
+            
+            st.write("**Período por defecto:**")
+            st.selectbox(
+                "",
+                _PERIODS,
+                key="viz_default_period"
+            )
         
-        st.write("**Formato de números:**")
-        number_format = st.selectbox(
-            "",
-            ["1,234.56", "1.234,56", "1 234.56"]
+        with col2:
+            st.write("**Actualización de datos:**")
+            st.selectbox(
+                "",
+                _REFRESH_FREQUENCIES,
+                key="viz_refresh_frequency"
+            )
+            
+            st.write("**Formato de números:**")
+            st.selectbox(
+                "",
+                _NUMBER_FORMATS,
+                key="viz_number_format"
+            )
+        
+        st.write("**Colores del dashboard:**")
+        st.selectbox(
+            "Esquema de colores:",
+            tuple(_COLOR_SCHEMES),
+            key="viz_color_scheme"
         )
-    
-    st.write("**Colores del dashboard:**")
-    color_scheme = st.selectbox(
-        "Esquema de colores:",
-        ["Azul profesional", "Verde natura", "Naranja vibrante", "Morado creativo"]
-    )
-    
-    col1, col2 = st.columns(2)
-    with col1:
-        if st.button("Atrás"):
-            st.session_state.current_step = 3
-            st.rerun()
-    
-    with col2:
-        if st.button("Continuar", type="primary"):
-            st.session_state.user_config.update({
-                'theme': theme,
-                'default_period': default_period,
-                'refresh_frequency': refresh_frequency,
-                'number_format': number_format,
-                'color_scheme': color_scheme
-            })
-            st.session_state.current_step = 5
-            st.rerun()
+        
+        col1, col2 = st.columns(2)
+        with col1:
+            st.form_submit_button("Atrás", on_click=_go_to_step, args=(3,))
+        with col2:
+            st.form_submit_button(
+                "Continuar", type="primary", on_click=_submit_step, args=(5, _VISUALIZATION_FIELDS)
+            )
 
 def show_step_final():
     """Paso 5: Resumen y finalización"""
@@ -470,50 +671,47 @@ def show_step_final():
     col1, col2 = st.columns(2)
     
     with col1:
-        st.write("**Configuración General:**")
-        st.write(f"• Empresa: {config.get('company_name', 'No especificada')}")
-        st.write(f"• Industria: {config.get('industry', 'No especificada')}")
-        st.write(f"• Moneda: {config.get('currency', 'USD')}")
-        
-        st.write("**Fuente de Datos:**")
-        data_source_names = {
-            'demo': 'Datos de demostración',
-            'csv': 'Archivo CSV/Excel',
-            'database': 'Base de datos',
-            'api': 'API externa'
-        }
-        st.write(f"• {data_source_names.get(config.get('data_source', 'demo'), 'Demo')}")
+        st.markdown(
+            "**Configuración General:**\n"
+            f"- Empresa: {config.get('company_name', 'No especificada')}\n"
+            f"- Industria: {config.get('industry', 'No especificada')}\n"
+            f"- Moneda: {config.get('currency', 'USD')}\n\n"
+            "**Fuente de Datos:**\n"
+            f"- {_DATA_SOURCE_NAMES.get(config.get('data_source', 'demo'), 'Demo')}"
+        )
     
     with col2:
-        st.write("**Preferencias:**")
-        st.write(f"• Tema: {config.get('theme', 'Claro')}")
-        st.write(f"• Período: {config.get('default_period', 'Últimos 30 días')}")
-        st.write(f"• Actualización: {config.get('refresh_frequency', 'Manual')}")
-        
-        st.write("**Métricas Seleccionadas:**")
-        total_metrics = len(config.get('metrics_sales', [])) + len(config.get('metrics_products', [])) + len(config.get('metrics_customers', [])) + len(config.get('metrics_geo', []))
-        st.write(f"• {total_metrics} métricas activas")
+        total_metrics = sum(map(len, (config.get(key, ()) for key in _METRIC_KEYS)))
+        st.markdown(
+            "**Preferencias:**\n"
+            f"- Tema: {config.get('theme', 'Claro')}\n"
+            f"- Período: {config.get('default_period', 'Últimos 30 días')}\n"
+            f"- Actualización: {config.get('refresh_frequency', 'Manual')}\n\n"
+            "**Métricas Seleccionadas:**\n"
+            f"- {total_metrics} métricas activas"
+        )
     
     st.markdown("---")
     
     col1, col2, col3 = st.columns(3)
     
     with col1:
-        if st.button("Atrás"):
-            st.session_state.current_step = 4
-            st.rerun()
+        st.button("Atrás", on_click=_go_to_step, args=(4,))
     
     with col2:
-        if st.button("Reiniciar configuración"):
-            for key in list(st.session_state.keys()):
-                del st.session_state[key]
-            st.rerun()
+        st.button("Reiniciar configuración", on_click=st.session_state.clear)
     
     with col3:
-        if st.button("Completar configuración", type="primary"):
-            st.session_state.onboarding_complete = True
-            st.balloons()
-            st.rerun()
+        st.button("Completar configuración", type="primary", on_click=_complete_onboarding)
+
+# Pasos del onboarding, indexados por current_step - 1
+_STEPS = (
+    show_step_welcome,
+    show_step_data_source,
+    show_step_metrics,
+    show_step_visualization,
+    show_step_final,
+)
 
 def show_dashboard():
     """Dashboard principal después del onboarding"""
@@ -525,54 +723,101 @@ def show_dashboard():
     
     # Botón para reconfigurar en la sidebar
     with st.sidebar:
-        st.write("**Configuración Actual:**")
-        st.write(f"Empresa: {company_name}")
-        st.write(f"Fuente: {config.get('data_source', 'demo')}")
-        
-        if st.button("🔧 Reconfigurar Dashboard"):
-            st.session_state.onboarding_complete = False
-            st.session_state.current_step = 1
-            st.rerun()
-    
-    # Cargar datos según configuración
-    df_ventas, df_productos, df_regiones = load_data_based_on_config()
+        show_dashboard_sidebar(config, company_name)
     
     # Mostrar métricas seleccionadas
     show_selected_metrics(config)
     
+    # Cargar solo los datos que usan las métricas activas
+    need_sales = "Ventas por Período" in config.get('metrics_sales', ())
+    need_products = "Productos Más Vendidos" in config.get('metrics_products', ())
+    need_regions = "Ventas por Región" in config.get('metrics_geo', ())
+    if not (need_sales or need_products or need_regions):
+        return
+    
+    df_ventas, df_productos, df_regiones = load_data_based_on_config(
+        need_sales, need_products, need_regions
+    )
+    
     # Mostrar visualizaciones
-    show_visualizations(df_ventas, df_productos, df_regiones, config)
+    if need_sales or need_products:
+        show_visualizations(df_ventas, df_productos, df_regiones, config)
 
-@st.cache_data
-def load_data_based_on_config():
-    """Cargar datos según la configuración del usuario"""
-    config = st.session_state.user_config
-    
-    if config.get('data_source') == 'csv' and 'uploaded_data' in config:
-        # Procesar datos cargados por el usuario
-        df = config['uploaded_data']
-        # Aquí procesarías los datos reales del usuario
-        # Por ahora retornamos datos de ejemplo
-        pass
+@st.fragment
+def show_dashboard_sidebar(config, company_name):
+    """Sidebar del dashboard; sus widgets solo vuelven a ejecutar este fragmento"""
+    st.markdown(
+        "**Configuración Actual:**\n\n"
+        f"Empresa: {company_name}\n\n"
+        f"Fuente: {config.get('data_source', 'demo')}"
+    )
     
-    # Datos de ejemplo (fallback)
-    df_ventas = pd.DataFrame({
-        'mes': ['Enero', 'Febrero', 'Marzo', 'Abril', 'Mayo', 'Junio'],
-        'ventas': [45000, 52000, 48000, 61000, 55000, 67000]
+    if st.button("🔧 Reconfigurar Dashboard"):
+        st.session_state.onboarding_complete = False
+        st.session_state.current_step = 1
+        st.rerun()
+
+# Datos de demostración compartidos entre sesiones (cache_resource no copia):
+# los consumidores solo los leen y no deben mutarlos
+@st.cache_resource
+def _load_ventas():
+    """Ventas mensuales de ejemplo"""
+    return pd.DataFrame({
+        'mes': pd.Categorical(['Enero', 'Febrero', 'Marzo', 'Abril', 'Mayo', 'Junio']),
+        'ventas': pd.array([45000, 52000, 48000, 61000, 55000, 67000], dtype='int32')
     })
-    
-    df_productos = pd.DataFrame({
-        'producto': ['Producto A', 'Producto B', 'Producto C', 'Producto D', 'Producto E'],
-        'cantidad': [120, 95, 180, 75, 140]
+
+@st.cache_resource
+def _load_productos():
+    """Cantidades por producto de ejemplo"""
+    return pd.DataFrame({
+        'producto': pd.Categorical(['Producto A', 'Producto B', 'Producto C', 'Producto D', 'Producto E']),
+        'cantidad': pd.array([120, 95, 180, 75, 140], dtype='int16')
     })
-    
-    df_regiones = pd.DataFrame({
-        'region': ['Norte', 'Sur', 'Este', 'Oeste'],
-        'ventas': [125000, 98000, 87000, 110000]
+
+@st.cache_resource
+def _load_regiones():
+    """Ventas por región de ejemplo"""
+    return pd.DataFrame({
+        'region': pd.Categorical(['Norte', 'Sur', 'Este', 'Oeste']),
+        'ventas': pd.array([125000, 98000, 87000, 110000], dtype='int32')
     })
+
+def load_data_based_on_config(need_sales=True, need_products=True, need_regions=True):
+    """Cargar datos según la configuración del usuario; None para los no requeridos"""
+    config = st.session_state.user_config
+    
+    # El archivo subido solo alimenta las ventas: no se lee si no se van a mostrar
+    df_ventas = None
+    upload_path = config.get('upload_path')
+    if need_sales and config.get('data_source') == 'csv' and upload_path and os.path.exists(upload_path):
+        try:
+            df_ventas = _monthly_sales(upload_path, config['date_column'], config['sales_column'])
+        except Exception as e:
+            st.error(
+                f"No se pudieron leer las columnas '{config['date_column']}' (fecha) y "
+                f"'{config['sales_column']}' (ventas numéricas) del archivo: {e}. "
+                "Se muestran datos de ejemplo."
+            )
+    
+    # Datos de ejemplo (fallback)
+    if need_sales and df_ventas is None:
+        df_ventas = _load_ventas()
+    df_productos = _load_productos() if need_products else None
+    df_regiones = _load_regiones() if need_regions else None
     
     return df_ventas, df_productos, df_regiones
 
+def _render_nothing():
+    """Métrica sin tarjeta asociada"""
+
+# Tarjeta de cada métrica de ventas; agregar aquí nuevas métricas
+_METRIC_RENDERERS = MappingProxyType({
+    "Ventas Totales": lambda: st.metric(label="Ventas Totales", value="$328,000", delta="12.5%"),
+    "Crecimiento de Ventas": lambda: st.metric(label="Crecimiento", value="15.3%", delta="2.1%"),
+})
+
+@st.fragment
 def show_selected_metrics(config):
     """Mostrar solo las métricas seleccionadas por el usuario"""
     metrics_sales = config.get('metrics_sales', [])
@@ -584,24 +829,42 @@ def show_selected_metrics(config):
         
         for i, metric in enumerate(metrics_sales):
             with cols[i]:
-                if metric == "Ventas Totales":
-                    st.metric(label="Ventas Totales", value="$328,000", delta="12.5%")
-                elif metric == "Crecimiento de Ventas":
-                    st.metric(label="Crecimiento", value="15.3%", delta="2.1%")
-                # Agregar más métricas según selección
+                _METRIC_RENDERERS.get(metric, _render_nothing)()
+
+@st.cache_resource(ttl=24 * 60 * 60)
+def _sales_chart(df_ventas, color):
+    """Gráfico de evolución de ventas, reutilizado mientras no cambien datos ni color"""
+    # Importación diferida: el onboarding no paga el costo de cargar altair
+    import altair as alt
+    
+    # sort=None conserva el orden cronológico de los meses
+    return (
+        alt.Chart(df_ventas, title='Evolución de Ventas Mensuales')
+        .mark_line(point=True, color=color)
+        .encode(x=alt.X('mes', sort=None), y='ventas')
+    )
 
+@st.cache_resource(ttl=24 * 60 * 60)
+def _products_chart(df_productos, colors):
+    """Gráfico de productos más vendidos, reutilizado mientras no cambien datos ni colores"""
+    import altair as alt
+    
+    return (
+        alt.Chart(df_productos, title='Ventas por Producto')
+        .mark_bar()
+        .encode(
+            x=alt.X('producto', sort=None),
+            y='cantidad',
+            color=alt.Color('producto', scale=alt.Scale(range=list(colors)), legend=None)
+        )
+    )
+
+@st.fragment
 def show_visualizations(df_ventas, df_productos, df_regiones, config):
     """Mostrar visualizaciones según configuración"""
     
     # Aplicar esquema de colores seleccionado
-    color_schemes = {
-        "Azul profesional": ['#1f77b4', '#aec7e8', '#ff7f0e', '#ffbb78'],
-        "Verde natura": ['#2ca02c', '#98df8a', '#d62728', '#ff9896'],
-        "Naranja vibrante": ['#ff7f0e', '#ffbb78', '#2ca02c', '#98df8a'],
-        "Morado creativo": ['#9467bd', '#c5b0d5', '#8c564b', '#c49c94']
-    }
-    
-    colors = color_schemes.get(config.get('color_scheme', 'Azul profesional'))
+    colors = _COLOR_SCHEMES.get(config.get('color_scheme'), _COLOR_SCHEMES['Azul profesional'])
     
     st.markdown("---")
     
@@ -611,26 +874,13 @@ def show_visualizations(df_ventas, df_productos, df_regiones, config):
         if "Ventas por Período" in config.get('metrics_sales', []):
             st.subheader("📈 Evolución de Ventas")
             
-            fig, ax = plt.subplots(figsize=(10, 6))
-            ax.plot(df_ventas['mes'], df_ventas['ventas'], 
-                   marker='o', linewidth=2, markersize=8, color=colors[0])
-            ax.set_title('Evolución de Ventas Mensuales', fontweight='bold')
-            ax.grid(True, alpha=0.3)
-            plt.xticks(rotation=45)
-            plt.tight_layout()
-            st.pyplot(fig)
+            st.altair_chart(_sales_chart(df_ventas, colors[0]), use_container_width=True)
     
     with col2:
         if "Productos Más Vendidos" in config.get('metrics_products', []):
             st.subheader("🛍️ Productos Más Vendidos")
             
-            fig, ax = plt.subplots(figsize=(10, 6))
-            bars = ax.bar(df_productos['producto'], df_productos['cantidad'], 
-                         color=colors)
-            ax.set_title('Ventas por Producto', fontweight='bold')
-            plt.xticks(rotation=45)
-            plt.tight_layout()
-            st.pyplot(fig)
+            st.altair_chart(_products_chart(df_productos, colors), use_container_width=True)
 
 # Lógica principal
 if not st.session_state.onboarding_complete:
@@ -285,36 +285,34 @@ class AIAnalyzer:
                 'recommendation': 'Crear más creativos de este tipo'
             },
             {
-                'type': 'critical',
-                'metric': 'Conversion Rate',
-                'channel': 'Google Ads',
-                'description': 'Tasa de conversión cayó 25% ayer',
-                'impact': 'alto',
-                'recommendation': 'Verificar landing pages y tracking'
+                'type': 'Imagen Estática',
+                'performance': 'medio',
+                'ctr': 2.1,
+                'cpc': 2.15,
+                'recommendation': 'Optimizar copy y call-to-action'
             },
             {
-                'type': 'positive',
-                'metric': 'ROAS',
-                'channel': 'Email Marketing',
-                'description': 'ROAS de email aumentó 60% esta semana',
-                'impact': 'alto',
-                'recommendation': 'Analizar qué cambió para replicar'
+                'type': 'Video Single',
+                'performance': 'bajo',
+                'ctr': 1.3,
+                'cpc': 3.45,
+                'recommendation': 'Considerar pausar o rediseñar'
             }
         ]
         
-        for anomaly in anomalies:
-            alerts.append({
-                'alert_type': anomaly['type'],
-                'metric_affected': anomaly['metric'],
-                'channel': anomaly['channel'],
-                'description': anomaly['description'],
-                'impact_level': anomaly['impact'],
-                'recommended_action': anomaly['recommendation'],
-                'detected_at': datetime.now().strftime('%Y-%m-%d %H:%M'),
-                'urgency': 'high' if anomaly['type'] == 'critical' else 'medium'
+        for creative in creative_types:
+            creative_insights.append({
+                'creative_type': creative['type'],
+                'performance_level': creative['performance'],
+                'metrics': {
+                    'ctr': creative['ctr'],
+                    'cpc': creative['cpc']
+                },
+                'recommendation': creative['recommendation'],
+                'priority': 'alta' if creative['performance'] in ['alto', 'bajo'] else 'media'
             })
         
-        return alerts
+        return creative_insights
     
     def _generate_predictive_insights(self, combined_metrics):
         """Generar insights predictivos"""
@@ -600,12 +598,10 @@ class AIAnalyzer:
         
         return recommendations
     
-    def generate_executive_summary(self):
-        """Generar resumen ejecutivo de insights"""
-        if not self.insights_cache:
-            insights = self._generate_demo_insights()
-        else:
-            insights = self.insights_cache
+    def generate_executive_summary(self, insights=None):
+        """Generar resumen ejecutivo de insights (acepta insights ya calculados)"""
+        if insights is None:
+            insights = self.insights_cache or self._generate_demo_insights()
         
         # Contar insights por tipo
         positive_insights = sum(1 for insight in insights.get('performance_insights', []) 
@@ -649,7 +645,7 @@ class AIAnalyzer:
                 'data_sources': ['Meta Ads', 'Google Ads', 'Email Marketing', 'E-commerce'],
                 'ai_model': 'Marketing Intelligence v2.1'
             },
-            'executive_summary': self.generate_executive_summary(),
+            'executive_summary': self.generate_executive_summary(insights),
             'detailed_insights': insights,
             'actionable_recommendations': self.get_actionable_recommendations()
         }
@@ -660,35 +656,6 @@ class AIAnalyzer:
             return report
         
         return report
-            {
-                'type': 'Imagen Estática',
-                'performance': 'medio',
-                'ctr': 2.1,
-                'cpc': 2.15,
-                'recommendation': 'Optimizar copy y call-to-action'
-            },
-            {
-                'type': 'Video Single',
-                'performance': 'bajo',
-                'ctr': 1.3,
-                'cpc': 3.45,
-                'recommendation': 'Considerar pausar o rediseñar'
-            }
-        ]
-        
-        for creative in creative_types:
-            creative_insights.append({
-                'creative_type': creative['type'],
-                'performance_level': creative['performance'],
-                'metrics': {
-                    'ctr': creative['ctr'],
-                    'cpc': creative['cpc']
-                },
-                'recommendation': creative['recommendation'],
-                'priority': 'alta' if creative['performance'] in ['alto', 'bajo'] else 'media'
-            })
-        
-        return creative_insights
     
     def _analyze_audience_performance(self, combined_metrics):
         """Analizar performance de audiencias"""
@@ -791,4 +758,36 @@ class AIAnalyzer:
                 'channel': 'Meta Ads',
                 'description': 'CPC incrementó 45% en los últimos 3 días',
                 'impact': 'medio',
-                'recommendation': 'Revisar pujas y competencia'
\ No newline at end of file
+                'recommendation': 'Revisar pujas y competencia'
+            },
+            {
+                'type': 'critical',
+                'metric': 'Conversion Rate',
+                'channel': 'Google Ads',
+                'description': 'Tasa de conversión cayó 25% ayer',
+                'impact': 'alto',
+                'recommendation': 'Verificar landing pages y tracking'
+            },
+            {
+                'type': 'positive',
+                'metric': 'ROAS',
+                'channel': 'Email Marketing',
+                'description': 'ROAS de email aumentó 60% esta semana',
+                'impact': 'alto',
+                'recommendation': 'Analizar qué cambió para replicar'
+            }
+        ]
+        
+        for anomaly in anomalies:
+            alerts.append({
+                'alert_type': anomaly['type'],
+                'metric_affected': anomaly['metric'],
+                'channel': anomaly['channel'],
+                'description': anomaly['description'],
+                'impact_level': anomaly['impact'],
+                'recommended_action': anomaly['recommendation'],
+                'detected_at': datetime.now().strftime('%Y-%m-%d %H:%M'),
+                'urgency': 'high' if anomaly['type'] == 'critical' else 'medium'
+            })
+        
+        return alerts
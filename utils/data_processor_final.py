@@ -3,9 +3,38 @@ import streamlit as st
 import pandas as pd
 import numpy as np
 from datetime import datetime, timedelta
-import plotly.express as px
-import plotly.graph_objects as go
-from plotly.subplots import make_subplots
+
+# Puntos máximos por serie temporal enviados al navegador
+MAX_CHART_POINTS = 2000
+
+def _lttb_indices(x, y, n_out):
+    """Índices elegidos por Largest-Triangle-Three-Buckets para reducir una serie a n_out puntos"""
+    n = len(x)
+    if n_out >= n or n_out < 3:
+        return np.arange(n)
+    
+    x = np.asarray(x, dtype=np.float64)
+    y = np.asarray(y, dtype=np.float64)
+    edges = np.linspace(1, n - 1, n_out - 1).astype(np.int64)
+    
+    indices = np.empty(n_out, dtype=np.int64)
+    indices[0], indices[-1] = 0, n - 1
+    previous = 0
+    for i in range(n_out - 2):
+        start, end = edges[i], edges[i + 1]
+        # Promedio del siguiente bucket (o el último punto) como tercer vértice
+        next_end = edges[i + 2] if i + 2 < len(edges) else n
+        avg_x = x[end:next_end].mean()
+        avg_y = y[end:next_end].mean()
+        
+        areas = np.abs(
+            (x[previous] - avg_x) * (y[start:end] - y[previous])
+            - (x[previous] - x[start:end]) * (avg_y - y[previous])
+        )
+        previous = start + int(areas.argmax())
+        indices[i + 1] = previous
+    
+    return indices
 
 class DataProcessor:
     def __init__(self):
@@ -50,6 +79,14 @@ class DataProcessor:
         """Estandarizar formato de datos según la fuente"""
         standardized = data.copy()
         
+        # Columnas respaldadas por Arrow a numpy: el resto del pipeline asume arrays numpy
+        arrow_columns = {
+            col: dtype.numpy_dtype for col, dtype in standardized.dtypes.items()
+            if isinstance(dtype, pd.ArrowDtype)
+        }
+        if arrow_columns:
+            standardized = standardized.astype(arrow_columns)
+        
         # Asegurar que hay columna de fecha
         if 'date' not in standardized.columns:
             date_columns = [col for col in standardized.columns 
@@ -314,11 +351,12 @@ class DataProcessor:
             if len(daily_totals) > 1:
                 for metric in ['spend', 'revenue', 'conversions']:
                     if metric in daily_totals.columns:
-                        values = daily_totals[metric].values
+                        values = daily_totals[metric]
                         if len(values) > 7:
                             # Calcular tendencia de últimos 7 días vs 7 días anteriores
-                            recent_avg = values[-7:].mean()
-                            previous_avg = values[-14:-7].mean() if len(values) >= 14 else values[:-7].mean()
+                            # (.iloc sobre la Series: vale para columnas numpy o Arrow)
+                            recent_avg = float(values.iloc[-7:].mean())
+                            previous_avg = float(values.iloc[-14:-7].mean() if len(values) >= 14 else values.iloc[:-7].mean())
                             
                             if previous_avg > 0:
                                 trend_pct = ((recent_avg - previous_avg) / previous_avg) * 100
@@ -452,33 +490,49 @@ class DataProcessor:
     
     def _create_revenue_trend_chart(self, processed_data):
         """Crear gráfico de tendencia de revenue"""
+        import plotly.express as px
+        import plotly.graph_objects as go
+        
         trends = processed_data['combined_metrics'].get('trends', {})
         daily_data = trends.get('daily_data')
         
         if daily_data is not None and not daily_data.empty:
+            daily_data = daily_data.assign(trend=daily_data['revenue'].rolling(window=7).mean())
+            
+            # Series largas: enviar solo los puntos que preservan la forma visual
+            if len(daily_data) > MAX_CHART_POINTS:
+                x = pd.to_datetime(daily_data['date']).astype('int64')
+                keep = _lttb_indices(x.to_numpy(), daily_data['revenue'].to_numpy(), MAX_CHART_POINTS)
+                daily_data = daily_data.iloc[keep]
+            
             fig = px.line(
                 daily_data, 
                 x='date', 
                 y='revenue',
                 title='Tendencia de Revenue (30 días)',
-                labels={'revenue': 'Revenue ($)', 'date': 'Fecha'}
+                labels={'revenue': 'Revenue ($)', 'date': 'Fecha'},
+                render_mode='webgl'
             )
             
+            # Hover unificado por fecha: evita buscar el punto más cercano entre todas las trazas
             fig.update_layout(
                 plot_bgcolor='rgba(0,0,0,0)',
                 paper_bgcolor='rgba(0,0,0,0)',
                 font=dict(color='#333'),
-                title_font_size=16
+                title_font_size=16,
+                hovermode='x unified',
+                spikedistance=0,
+                dragmode='pan'
             )
             
             # Agregar línea de tendencia
-            fig.add_scatter(
+            fig.add_trace(go.Scattergl(
                 x=daily_data['date'],
-                y=daily_data['revenue'].rolling(window=7).mean(),
+                y=daily_data['trend'],
                 mode='lines',
                 name='Tendencia (7 días)',
                 line=dict(color='red', dash='dash')
-            )
+            ))
             
             return fig
         
@@ -486,6 +540,8 @@ class DataProcessor:
     
     def _create_channel_performance_chart(self, processed_data):
         """Crear gráfico de performance por canal"""
+        import plotly.graph_objects as go
+        
         performance = processed_data['combined_metrics'].get('performance', {})
         channel_ranking = performance.get('channel_ranking', [])
         
@@ -526,6 +582,8 @@ class DataProcessor:
     
     def _create_roas_comparison_chart(self, processed_data):
         """Crear gráfico de comparación de ROAS"""
+        import plotly.graph_objects as go
+        
         performance = processed_data['combined_metrics'].get('performance', {})
         channel_ranking = performance.get('channel_ranking', [])
         
@@ -572,6 +630,8 @@ class DataProcessor:
     
     def _create_spend_vs_revenue_chart(self, processed_data):
         """Crear gráfico scatter de gasto vs revenue"""
+        import plotly.express as px
+        
         performance = processed_data['combined_metrics'].get('performance', {})
         channel_ranking = performance.get('channel_ranking', [])
         
@@ -584,7 +644,8 @@ class DataProcessor:
                 hover_name=[ch['channel'].title() for ch in channel_ranking],
                 labels={'x': 'Spend ($)', 'y': 'Revenue ($)', 'color': 'ROAS'},
                 title='Relación Spend vs Revenue por Canal',
-                color_continuous_scale='RdYlGn'
+                color_continuous_scale='RdYlGn',
+                render_mode='webgl'
             )
             
             fig.update_layout(
@@ -599,6 +660,8 @@ class DataProcessor:
     
     def _create_conversion_funnel_chart(self, processed_data):
         """Crear gráfico de funnel de conversión"""
+        import plotly.graph_objects as go
+        
         overview = processed_data['combined_metrics'].get('overview', {})
         
         # Simular datos de funnel